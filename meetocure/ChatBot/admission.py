@@ -0,0 +1,158 @@
+"""Admission control in front of the chat endpoints.
+
+At most max_active requests run at once. Others wait in a priority queue
+(doctor before patient before batch, FIFO within a class) bounded by
+max_queue entries and max_wait_seconds; anything beyond that is shed with a
+Retry-After hint instead of piling up behind slow model calls.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+
+PRIORITIES = {"doctor": 0, "patient": 1, "batch": 2}
+DEFAULT_PRIORITY = "patient"
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed: 429 when the queue is full, 503 when it waited too long or was displaced"""
+
+    def __init__(self, status_code, reason, retry_after):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admitted request's slot; release() is idempotent"""
+    __slots__ = ("_controller", "_released", "started")
+
+    def __init__(self, controller):
+        self._controller = controller
+        self._released = False
+        self.started = time.monotonic()
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._observe(time.monotonic() - self.started)
+            self._controller._release()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    def __init__(self, max_active=8, max_queue=64, max_wait_seconds=10.0):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.active = 0
+        self._queue = []  # (priority, seq, future)
+        self._seq = itertools.count()
+        self._waiting = 0
+        # Smoothed time a request holds its slot, for Retry-After estimates
+        self._service_seconds = 1.0
+
+        self.admitted = dict.fromkeys(PRIORITIES, 0)
+        self.shed = {"queue_full": 0, "wait_timeout": 0, "displaced": 0}
+        self.max_depth_seen = 0
+        self._wait_total = dict.fromkeys(PRIORITIES, 0.0)
+        self._wait_max = dict.fromkeys(PRIORITIES, 0.0)
+
+    def retry_after(self):
+        """Seconds until a new request would likely get a slot"""
+        backlog = (self._waiting + 1) * self._service_seconds / max(self.max_active, 1)
+        return max(1, math.ceil(backlog))
+
+    def _record_wait(self, priority, waited):
+        self.admitted[priority] += 1
+        self._wait_total[priority] += waited
+        self._wait_max[priority] = max(self._wait_max[priority], waited)
+
+    async def acquire(self, priority=DEFAULT_PRIORITY):
+        """Wait for a slot and return its Ticket, or raise Overloaded"""
+        if priority not in PRIORITIES:
+            priority = DEFAULT_PRIORITY
+        if self.active < self.max_active and not self._waiting:
+            self.active += 1
+            self._record_wait(priority, 0.0)
+            return Ticket(self)
+
+        if self._waiting >= self.max_queue and not self._displace(PRIORITIES[priority]):
+            self.shed["queue_full"] += 1
+            raise Overloaded(429, "queue_full", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (PRIORITIES[priority], next(self._seq), future))
+        self._waiting += 1
+        self.max_depth_seen = max(self.max_depth_seen, self._waiting)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait_seconds)
+        except Overloaded:
+            raise
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # The slot was handed over just as we gave up; pass it on
+                self._release()
+            elif not future.done():
+                future.cancel()
+                self._waiting -= 1
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            self.shed["wait_timeout"] += 1
+            raise Overloaded(503, "wait_timeout", self.retry_after()) from None
+        self._record_wait(priority, time.monotonic() - started)
+        return Ticket(self)
+
+    def _displace(self, rank):
+        """Make room for a higher-priority request by shedding the newest lowest-priority waiter"""
+        live = [entry for entry in self._queue if not entry[2].done()]
+        if not live:
+            return False
+        victim = max(live, key=lambda entry: (entry[0], entry[1]))
+        if victim[0] <= rank:
+            return False
+        self._waiting -= 1
+        self.shed["displaced"] += 1
+        victim[2].set_exception(Overloaded(503, "displaced", self.retry_after()))
+        return True
+
+    def _observe(self, held):
+        self._service_seconds = 0.9 * self._service_seconds + 0.1 * held
+
+    def _release(self):
+        # Hand the slot straight to the best waiter so it cannot be taken by a newcomer
+        while self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                self._waiting -= 1
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "max_active": self.max_active,
+            "queue_depth": self._waiting,
+            "max_queue": self.max_queue,
+            "max_depth_seen": self.max_depth_seen,
+            "max_wait_seconds": self.max_wait_seconds,
+            "admitted": dict(self.admitted),
+            "shed": dict(self.shed),
+            "wait_seconds": {
+                name: {
+                    "mean": self._wait_total[name] / self.admitted[name] if self.admitted[name] else 0.0,
+                    "max": self._wait_max[name],
+                }
+                for name in PRIORITIES
+            },
+            "retry_after": self.retry_after(),
+        }
@@ -0,0 +1 @@
+"""Benchmarks for the chatbot service; run from the ChatBot directory with `python -m benchmarks.<name>`."""
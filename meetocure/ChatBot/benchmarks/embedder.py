@@ -0,0 +1,136 @@
+"""Compare the torch and ONNX embedders on the current index snapshot.
+
+Each backend runs in its own subprocess, so load time, resident memory and
+the modules it imports are its own. Reports, per backend: load time, memory,
+single-query latency, batch throughput and whether torch got imported; and
+for the pair: cosine agreement of the query vectors and recall@k of the ONNX
+query vectors' top-k against the torch ones on the real index.
+
+    python -m benchmarks.embedder --queries 200 --k 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import index_store
+from benchmarks.retrieval import percentiles, rss_mb
+from numpy_index import NumpyIndex
+
+
+def sample_texts(snapshot, queries, documents, seed=0):
+    """Question-like queries and chunk texts drawn from the snapshot"""
+    index = NumpyIndex(os.path.join(snapshot, index_store.NUMPY_DIR))
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(index), size=min(queries, len(index)), replace=False)
+    out_queries = []
+    for row in rows:
+        title = index.metadata[row].get("title")
+        # Without entry titles, the opening words of a chunk stand in for a question about it
+        out_queries.append(f"What is {title}?" if title else " ".join(index.text(row).split()[:12]))
+    doc_rows = rng.choice(len(index), size=min(documents, len(index)), replace=False)
+    return out_queries, [index.text(row) for row in doc_rows]
+
+
+def run_backend(backend, texts_path, vectors_path, batch_size):
+    """Child process: load one backend, time it and save its query vectors"""
+    from embedders import load_embeddings
+
+    with open(texts_path, encoding="utf-8") as f:
+        texts = json.load(f)
+    rss_start = rss_mb()
+    started = time.perf_counter()
+    embeddings = load_embeddings(backend, batch_size=batch_size)
+    embeddings.embed_query("warm up")
+    load_seconds = time.perf_counter() - started
+
+    single = []
+    vectors = []
+    for query in texts["queries"]:
+        started = time.perf_counter()
+        vectors.append(embeddings.embed_query(query))
+        single.append(time.perf_counter() - started)
+    np.save(vectors_path, np.asarray(vectors, dtype=np.float32))
+
+    started = time.perf_counter()
+    embeddings.embed_documents(texts["documents"])
+    batch_elapsed = time.perf_counter() - started
+
+    return {
+        "load_s": load_seconds,
+        "single_query": percentiles(single),
+        "documents_per_s": len(texts["documents"]) / batch_elapsed,
+        "rss_mb": rss_mb(),
+        "rss_start_mb": rss_start,
+        "torch_imported": "torch" in sys.modules,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--version", default=None, help="Snapshot version (default: CURRENT)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--documents", type=int, default=256, help="Chunks embedded for the throughput test")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--backends", default="torch,onnx", help="Comma-separated; the first is the reference")
+    parser.add_argument("--out", default=None, help="Write the JSON report here")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--texts", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--vectors", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_backend(args.child, args.texts, args.vectors, args.batch_size)))
+        return
+
+    version = args.version or index_store.current_version()
+    if version is None:
+        raise SystemExit("No index built yet; run `python build_index.py` first")
+    snapshot = index_store.version_path(version)
+    queries, documents = sample_texts(snapshot, args.queries, args.documents)
+    backends = args.backends.split(",")
+
+    report = {"version": version, "queries": len(queries), "documents": len(documents), "k": args.k, "backends": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        texts_path = os.path.join(tmp, "texts.json")
+        with open(texts_path, "w", encoding="utf-8") as f:
+            json.dump({"queries": queries, "documents": documents}, f)
+        vectors = {}
+        for backend in backends:
+            vectors_path = os.path.join(tmp, f"{backend}.npy")
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.embedder", "--child", backend, "--texts", texts_path,
+                 "--vectors", vectors_path, "--batch-size", str(args.batch_size)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            report["backends"][backend] = json.loads(output.strip().splitlines()[-1])
+            vectors[backend] = np.load(vectors_path)
+
+    # The index was built with the reference backend; other backends only embed the queries
+    index = NumpyIndex(os.path.join(snapshot, index_store.NUMPY_DIR))
+    reference = backends[0]
+    reference_hits = [{row for row, _ in hits} for hits in index.search(vectors[reference], args.k)]
+    for backend in backends[1:]:
+        hits = [{row for row, _ in found} for found in index.search(vectors[backend], args.k)]
+        cosine = (vectors[backend] * vectors[reference]).sum(axis=1)
+        report["backends"][backend]["vs_" + reference] = {
+            f"recall_at_{args.k}": float(np.mean([len(a & b) / max(len(b), 1) for a, b in zip(hits, reference_hits)])),
+            "cosine_mean": float(cosine.mean()),
+            "cosine_min": float(cosine.min()),
+        }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
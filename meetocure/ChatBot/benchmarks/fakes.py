@@ -0,0 +1,220 @@
+"""Local stand-ins for the Together models, the embedding model and the encyclopedia.
+
+Everything here is deterministic for a given seed, so two benchmark runs with
+the same settings see the same questions, vectors, failures and answers.
+"""
+import asyncio
+import hashlib
+import os
+import random
+import threading
+import time
+
+import numpy as np
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+import index_store
+from bm25_index import BM25IndexWriter, tokenize
+from history import estimate_tokens
+from numpy_index import NumpyIndexWriter
+from title_index import TitleIndexWriter
+
+
+class FakeUpstreamError(RuntimeError):
+    """What a failed Together call looks like to the pipeline"""
+
+
+class FakeChatModel:
+    """Drop-in for ChatTogether: time to first token, then a steady token rate.
+
+    Time to first token is latency plus prompt tokens / prefill_tokens_per_second,
+    so longer prompts answer later. failure_rate of the calls raise
+    FakeUpstreamError after that delay, like a 5xx from the API.
+    """
+
+    def __init__(self, name, latency=0.3, tokens_per_second=60.0, completion_tokens=60,
+                 failure_rate=0.0, seed=0, prefill_tokens_per_second=None):
+        self.name = name
+        self.latency = latency
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+
+    def _tokens(self, messages):
+        question = messages[-1].content if messages else ""
+        words = f"[{self.name}] answer to: {question}".split()
+        filler = ("this", "is", "a", "simulated", "medical", "answer")
+        while len(words) < self.completion_tokens:
+            words.append(filler[len(words) % len(filler)])
+        return [w + " " for w in words[:self.completion_tokens]]
+
+    def _usage(self, messages, tokens):
+        prompt = sum(estimate_tokens(m.content) for m in messages)
+        return {"input_tokens": prompt, "output_tokens": len(tokens), "total_tokens": prompt + len(tokens)}
+
+    async def _start(self, messages):
+        self.calls += 1
+        prefill = 0.0
+        if self.prefill_tokens_per_second:
+            prefill = sum(estimate_tokens(m.content) for m in messages) / self.prefill_tokens_per_second
+        await asyncio.sleep(self.latency + prefill)
+        if self._rng.random() < self.failure_rate:
+            self.failures += 1
+            raise FakeUpstreamError(f"{self.name}: simulated 503 from upstream")
+
+    async def ainvoke(self, messages, **kwargs):
+        await self._start(messages)
+        tokens = self._tokens(messages)
+        await asyncio.sleep(len(tokens) / self.tokens_per_second)
+        return AIMessage(content="".join(tokens).strip(), usage_metadata=self._usage(messages, tokens))
+
+    async def astream(self, messages, **kwargs):
+        await self._start(messages)
+        for token in self._tokens(messages):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            yield AIMessageChunk(content=token)
+
+    def invoke(self, messages, **kwargs):
+        return asyncio.run(self.ainvoke(messages))
+
+
+class FakeEmbeddings:
+    """Hashed bag-of-words vectors: texts sharing words land close together.
+
+    Each call costs latency plus item_latency per text, spent with time.sleep
+    while holding a lock: like a CPU-bound model whose forward pass already
+    uses every core, concurrent calls queue instead of overlapping.
+    """
+
+    def __init__(self, dim=384, latency=0.0, item_latency=0.0):
+        self.dim = dim
+        self.latency = latency
+        self.item_latency = item_latency
+        self._busy = threading.Lock()
+        self.calls = 0
+
+    def _vector(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in tokenize(text):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _forward(self, count):
+        self.calls += 1
+        if self.latency or self.item_latency:
+            with self._busy:
+                time.sleep(self.latency + self.item_latency * count)
+
+    def embed_query(self, text):
+        self._forward(1)
+        return self._vector(text)
+
+    def embed_documents(self, texts):
+        self._forward(len(texts))
+        return [self._vector(t) for t in texts]
+
+
+CONDITIONS = (
+    "asthma", "diabetes", "hypertension", "migraine", "influenza", "malaria", "dengue", "typhoid",
+    "anemia", "arthritis", "bronchitis", "pneumonia", "tuberculosis", "eczema", "psoriasis", "gout",
+    "hepatitis", "jaundice", "cholera", "measles", "mumps", "chickenpox", "sinusitis", "tonsillitis",
+    "appendicitis", "gastritis", "ulcer", "kidney stones", "cataract", "glaucoma", "osteoporosis",
+    "thyroid disorder", "obesity", "insomnia", "depression", "anxiety", "allergy", "acne", "scabies",
+    "conjunctivitis",
+)
+SYMPTOMS = (
+    "fever", "cough", "headache", "fatigue", "nausea", "joint pain", "rash", "itching", "dizziness",
+    "shortness of breath", "chest pain", "weight loss", "blurred vision", "abdominal pain", "swelling",
+)
+TREATMENTS = (
+    "rest and fluids", "prescribed antibiotics", "anti-inflammatory medicine", "inhalers",
+    "insulin or oral medicine", "lifestyle changes", "surgery in severe cases", "antiviral medicine",
+    "topical creams", "a balanced diet and exercise",
+)
+QUESTION_TEMPLATES = (
+    "What is {c}?",
+    "What are the symptoms of {c}?",
+    "How is {c} treated?",
+    "Is {c} contagious?",
+    "I have {s} and {s2}, could it be {c}?",
+    "What causes {c} and how can I prevent it?",
+)
+CAUSES = (
+    "a viral infection", "a bacterial infection", "an inherited tendency", "poor sanitation",
+    "an immune reaction", "long-term inflammation", "a hormone imbalance", "mosquito bites",
+)
+CASUAL = ("hi", "hello", "thanks", "good morning", "bye", "how are you")
+
+
+def synthetic_corpus(entries=200, seed=0):
+    """(title, text) encyclopedia-style entries built from the condition tables"""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(entries):
+        condition = CONDITIONS[i % len(CONDITIONS)]
+        title = condition.title() if i < len(CONDITIONS) else f"{condition.title()} ({i // len(CONDITIONS)})"
+        symptoms = rng.sample(SYMPTOMS, 3)
+        treatment = rng.choice(TREATMENTS)
+        cause = rng.choice(CAUSES)
+        # Encyclopedia-length entries (~900 characters), so context compression has work to do
+        text = (
+            f"{title}. {condition.capitalize()} is a condition that commonly causes {symptoms[0]}, "
+            f"{symptoms[1]} and {symptoms[2]}. It is often caused by {cause}, and people with a weak "
+            f"immune system, young children and older adults are at greater risk. "
+            f"It is usually diagnosed from the history and an examination, and blood tests or imaging "
+            f"may be used to rule out other conditions. It is managed with {treatment}. "
+            f"Most people recover fully when treatment starts early. Untreated, it can lead to "
+            f"complications that need care in hospital. Prevention includes good hygiene, a healthy diet, "
+            f"regular exercise and avoiding known triggers. See a doctor if the {symptoms[0]} lasts more "
+            f"than a few days, or at once if there is {rng.choice(SYMPTOMS)} with confusion or fainting."
+        )
+        corpus.append((title, text))
+    return corpus
+
+
+def synthetic_questions(count, distinct=None, casual_ratio=0.1, seed=0):
+    """Benchmark questions; with distinct set, questions repeat from a pool of that size"""
+    rng = random.Random(seed)
+
+    def make():
+        if rng.random() < casual_ratio:
+            return rng.choice(CASUAL)
+        s, s2 = rng.sample(SYMPTOMS, 2)
+        return rng.choice(QUESTION_TEMPLATES).format(c=rng.choice(CONDITIONS), s=s, s2=s2)
+
+    if distinct:
+        pool = [make() for _ in range(distinct)]
+        return [rng.choice(pool) for _ in range(count)]
+    return [make() for _ in range(count)]
+
+
+def build_snapshot(root, embeddings, corpus):
+    """Write a NumPy + BM25 + titles snapshot of corpus under root and make it CURRENT"""
+    version = index_store.next_version(root)
+    path = index_store.version_path(version, root)
+    numpy_writer = NumpyIndexWriter(os.path.join(path, index_store.NUMPY_DIR))
+    bm25_writer = BM25IndexWriter(os.path.join(path, index_store.BM25_DIR))
+    title_writer = TitleIndexWriter(os.path.join(path, index_store.TITLES_DIR))
+
+    titles = [title for title, _ in corpus]
+    texts = [text for _, text in corpus]
+    ids = [hashlib.sha256(text.encode("utf-8")).hexdigest()[:16] for text in texts]
+    metadatas = [{"source": "synthetic", "page": i, "title": title} for i, title in enumerate(titles)]
+    numpy_writer.add(ids, embeddings.embed_documents(texts), texts, metadatas)
+    bm25_writer.add(texts)
+    for row, (title, text) in enumerate(corpus):
+        title_writer.add(row, title, text)
+    numpy_writer.close()
+    bm25_writer.close()
+    title_writer.close()
+
+    index_store.write_manifest(version, {"source": "synthetic", "chunks": len(corpus)}, root)
+    index_store.set_current(version, root)
+    return path
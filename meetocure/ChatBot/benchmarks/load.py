@@ -0,0 +1,225 @@
+"""Load-test the real FastAPI app with local model, embedding and corpus stand-ins.
+
+Nothing leaves the process: requests go through httpx's ASGI transport into
+main.app, the assistant is built with benchmarks.fakes components, and the
+retrieval index is a synthetic snapshot in a temporary directory. Runs are
+deterministic for a given --seed, so reports from two commits are comparable.
+
+    python -m benchmarks.load --requests 500 --concurrency 16 --llm-latency 0.4
+    python -m benchmarks.load --distinct 50 --compare benchmarks/results/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings, build_snapshot, synthetic_corpus, synthetic_questions
+from benchmarks.retrieval import percentiles
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def build_app(args, index_root):
+    """The real app with a MedicalAssistant made of local stand-ins"""
+    import chatbot_response
+    import main
+    from retrievers import open_retriever
+
+    embeddings = FakeEmbeddings(latency=args.embed_latency, item_latency=args.embed_item_latency)
+    snapshot = build_snapshot(index_root, embeddings, synthetic_corpus(args.corpus, seed=args.seed))
+    # Every run starts from empty, durable history instead of the sessions of earlier runs
+    os.environ["CHATBOT_HISTORY_DB"] = os.path.join(index_root, "history.sqlite3")
+    llm_medical = FakeChatModel(
+        "medical", latency=args.llm_latency, tokens_per_second=args.token_rate,
+        completion_tokens=args.completion_tokens, failure_rate=args.failure_rate, seed=args.seed,
+        prefill_tokens_per_second=args.prefill_rate,
+    )
+    llm_fast = FakeChatModel(
+        "fast", latency=args.fast_latency, tokens_per_second=args.token_rate * 3,
+        completion_tokens=args.completion_tokens // 2, failure_rate=args.failure_rate / 2, seed=args.seed + 1,
+        prefill_tokens_per_second=args.prefill_rate * 3,
+    )
+    chatbot_response.medical_assistant = chatbot_response.MedicalAssistant(
+        embeddings=embeddings,
+        retriever=open_retriever(snapshot, embeddings, backend=args.retriever),
+        llm_medical=llm_medical,
+        llm_fast=llm_fast,
+    )
+    return main.app, chatbot_response.medical_assistant
+
+
+async def one_request(client, path, body, stream):
+    """(status, latency_s, time_to_first_token_s, stats) for one call"""
+    started = time.perf_counter()
+    if not stream:
+        response = await client.post(path, json=body)
+        latency = time.perf_counter() - started
+        stats = response.json().get("stats", {}) if response.status_code == 200 else {}
+        return response.status_code, latency, None, stats
+
+    first_token = None
+    stats = {}
+    async with client.stream("POST", path + "/stream", json=body) as response:
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                if event == "done":
+                    stats = json.loads(line[5:]).get("stats", {})
+                event = None
+    return response.status_code, time.perf_counter() - started, first_token, stats
+
+
+async def drive(app, questions, args):
+    """Closed loop: --concurrency workers each send their next request as soon as one returns"""
+    queue = asyncio.Queue()
+    for i, question in enumerate(questions):
+        body = {"text": question}
+        if args.sessions:
+            body["patientId"] = f"bench-{i % args.sessions}"
+        queue.put_nowait(body)
+
+    samples = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def worker():
+            while True:
+                try:
+                    body = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                samples.append(await one_request(client, "/assistance", body, args.stream))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        service = {
+            "admission": (await client.get("/assistance/admission")).json(),
+            "cache": (await client.get("/assistance/cache")).json(),
+            "llm": (await client.get("/assistance/llm")).json(),
+            "embedding": (await client.get("/assistance/embedding")).json(),
+        }
+    return samples, elapsed, service
+
+
+def token_summary(samples, key):
+    """Mean and p95 of a per-request token count, over requests that ran the model"""
+    values = [s[3][key] for s in samples if s[3].get(key) is not None and not s[3].get("coalesced")]
+    if not values:
+        return None
+    return {"mean": float(np.mean(values)), "p95": float(np.percentile(values, 95))}
+
+
+def summarize(samples, elapsed, service, assistant, args):
+    ok = [s for s in samples if s[0] == 200]
+    stages = defaultdict(list)
+    for _, _, _, stats in ok:
+        if stats.get("coalesced"):
+            continue
+        for stage, ms in stats.get("timings_ms", {}).items():
+            stages[stage].append(ms / 1000)
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": vars(args),
+        "requests": len(samples),
+        "duration_s": elapsed,
+        "rps": len(samples) / elapsed if elapsed else None,
+        "latency": percentiles([s[1] for s in ok]) if ok else None,
+        "status": dict(Counter(str(s[0]) for s in samples)),
+        "route": dict(Counter(s[3].get("route", "none") for s in ok)),
+        "served_by": dict(Counter(s[3].get("served_by", "none") for s in ok)),
+        "cache": dict(Counter(s[3].get("cache", "none") for s in ok)),
+        "coalesced": sum(1 for s in ok if s[3].get("coalesced")),
+        "errors": dict(Counter(s[3]["error"] for s in ok if "error" in s[3])),
+        "stages": {stage: percentiles(values) for stage, values in sorted(stages.items())},
+        "prompt_tokens": token_summary(ok, "prompt_tokens"),
+        "context_tokens": token_summary(ok, "context_tokens"),
+        "context_tokens_raw": token_summary(ok, "context_tokens_raw"),
+        "upstream_calls": {
+            "medical": assistant.llm_medical.calls,
+            "fast": assistant.llm_fast.calls,
+            "simulated_failures": assistant.llm_medical.failures + assistant.llm_fast.failures,
+        },
+        "service": service,
+    }
+    if args.stream:
+        ttft = [s[2] for s in ok if s[2] is not None]
+        report["time_to_first_token"] = percentiles(ttft) if ttft else None
+    return report
+
+
+def compare(report, baseline_path):
+    """Relative change of the headline numbers against an earlier report"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    def delta(new, old):
+        return None if not old or new is None else (new - old) / old
+
+    out = {"baseline": baseline_path, "rps": delta(report["rps"], baseline.get("rps"))}
+    out["prompt_tokens_mean"] = delta(
+        (report.get("prompt_tokens") or {}).get("mean"), (baseline.get("prompt_tokens") or {}).get("mean")
+    )
+    for key in ("p50_ms", "p95_ms", "p99_ms"):
+        out[key] = delta((report["latency"] or {}).get(key), (baseline.get("latency") or {}).get(key))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--stream", action="store_true", help="Use /assistance/stream and report time to first token")
+    parser.add_argument("--distinct", type=int, default=None, help="Draw questions from a pool of this size")
+    parser.add_argument("--casual-ratio", type=float, default=0.1)
+    parser.add_argument("--sessions", type=int, default=0, help="Spread requests over this many patient sessions")
+    parser.add_argument("--corpus", type=int, default=200, help="Synthetic encyclopedia entries")
+    parser.add_argument("--retriever", choices=("numpy", "hybrid"), default="numpy")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Medical model time to first token (s)")
+    parser.add_argument("--fast-latency", type=float, default=0.1, help="Fast model time to first token (s)")
+    parser.add_argument("--token-rate", type=float, default=60.0, help="Medical model tokens per second")
+    parser.add_argument("--completion-tokens", type=int, default=60)
+    parser.add_argument("--prefill-rate", type=float, default=2000.0, help="Medical model prompt tokens per second")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--embed-latency", type=float, default=0.005, help="Seconds per embedding call")
+    parser.add_argument("--embed-item-latency", type=float, default=0.0005, help="Extra seconds per text in a call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="Report path (default: benchmarks/results/load-<time>.json)")
+    parser.add_argument("--compare", default=None, help="Earlier report to compare against")
+    args = parser.parse_args()
+
+    np.random.seed(args.seed)
+    questions = synthetic_questions(args.requests, args.distinct, args.casual_ratio, seed=args.seed)
+    with tempfile.TemporaryDirectory() as index_root:
+        app, assistant = build_app(args, index_root)
+        samples, elapsed, service = asyncio.run(drive(app, questions, args))
+    report = summarize(samples, elapsed, service, assistant, args)
+    if args.compare:
+        report["compare"] = compare(report, args.compare)
+
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"load-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    )
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps({k: report[k] for k in ("requests", "rps", "latency", "status", "served_by", "cache", "prompt_tokens")}, indent=2))
+    print("stages:", json.dumps(report["stages"], indent=2))
+    if args.compare:
+        print("vs baseline:", json.dumps(report["compare"], indent=2))
+    print(f"Report written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Compare the Chroma and memory-mapped NumPy retrieval backends on one snapshot.
+
+Queries are perturbed copies of indexed chunk vectors, so no embedding model
+is loaded and both backends see identical inputs.
+
+    python -m benchmarks.retrieval --queries 500 --k 5
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+import index_store
+from numpy_index import NumpyIndex
+from retrievers import ChromaRetriever, NumpyRetriever
+
+
+def rss_mb():
+    """Resident set size of this process in MB (Linux)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def percentiles(samples):
+    values = np.asarray(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+    }
+
+
+def time_backend(retriever, queries, k, batch_size):
+    single = []
+    results = []
+    for query in queries:
+        started = time.perf_counter()
+        docs = retriever.search(None, query, k)
+        single.append(time.perf_counter() - started)
+        results.append(docs)
+
+    started = time.perf_counter()
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start:start + batch_size]
+        retriever.search_batch([None] * len(batch), batch, k)
+    batch_elapsed = time.perf_counter() - started
+
+    return results, {
+        "single": percentiles(single),
+        "batch_queries_per_s": len(queries) / batch_elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--version", default=None, help="Snapshot version (default: CURRENT)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--out", default=None, help="Write the JSON report here")
+    args = parser.parse_args()
+
+    version = args.version or index_store.current_version()
+    if version is None:
+        raise SystemExit("No index built yet; run `python build_index.py` first")
+    snapshot = index_store.version_path(version)
+
+    rng = np.random.default_rng(0)
+    source = NumpyIndex(os.path.join(snapshot, index_store.NUMPY_DIR))
+    rows = rng.choice(len(source), size=min(args.queries, len(source)), replace=False)
+    base = np.asarray(source.vectors[rows], dtype=np.float32)
+    if source.scales is not None:
+        base *= np.asarray(source.scales[rows])[:, None]
+    queries = base + args.noise * rng.normal(size=base.shape).astype(np.float32)
+    del source
+
+    report = {"version": version, "queries": len(queries), "k": args.k, "backends": {}}
+    hits = {}
+    for name, factory in (
+        ("numpy", lambda: NumpyRetriever(os.path.join(snapshot, index_store.NUMPY_DIR))),
+        ("chroma", lambda: ChromaRetriever(os.path.join(snapshot, index_store.CHROMA_DIR), None)),
+    ):
+        rss_before = rss_mb()
+        started = time.perf_counter()
+        retriever = factory()
+        retriever.search(None, queries[0], args.k)  # first query pays for page faults / HNSW load
+        open_seconds = time.perf_counter() - started
+        results, timings = time_backend(retriever, queries, args.k, args.batch_size)
+        rss_after = rss_mb()
+        hits[name] = [[doc.page_content for doc in docs] for docs in results]
+        report["backends"][name] = {
+            "open_s": open_seconds,
+            **timings,
+            "rss_delta_mb": (rss_after - rss_before) if rss_before is not None else None,
+        }
+
+    # NumPy search is exact, so its results are the reference for Chroma's approximate HNSW
+    overlap = [
+        len(set(a) & set(b)) / max(len(a), 1) for a, b in zip(hits["numpy"], hits["chroma"])
+    ]
+    report["chroma_recall_at_k_vs_exact"] = float(np.mean(overlap))
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
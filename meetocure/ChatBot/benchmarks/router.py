@@ -0,0 +1,64 @@
+"""Micro-benchmark for the intent and language router.
+
+Cold timings bypass the lru_cache (every call scans the message); warm
+timings hit it, which is what repeated greetings see in production.
+
+    python -m benchmarks.router --repeat 20000
+"""
+import argparse
+import json
+import timeit
+
+from router import route_message
+
+MESSAGES = [
+    "hi",
+    "Hello!",
+    "thanks",
+    "bye",
+    "how are you",
+    "ela unnav",
+    "నమస్కారం",
+    "ధన్యవాదాలు",
+    "good morning doctor",
+    "nenu ela unnanu cheppu",
+    "What is asthma?",
+    "What are the early symptoms of type 2 diabetes and how is it diagnosed?",
+    "నాకు జ్వరం మరియు తలనొప్పి ఉంది, ఏమి చేయాలి?",
+    "hey, I have had a sore throat and a mild fever for three days, should I see a doctor?",
+]
+
+
+def per_call_us(func, repeat):
+    seconds = min(timeit.repeat(func, number=repeat, repeat=5))
+    return seconds / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20000, help="Calls per timing run")
+    parser.add_argument("--out", default=None, help="Write the JSON report here")
+    args = parser.parse_args()
+
+    uncached = route_message.__wrapped__
+    report = {"repeat": args.repeat, "messages": []}
+    for message in MESSAGES:
+        route = route_message(message)
+        report["messages"].append({
+            "text": message,
+            "language": route.language,
+            "intent": route.intent,
+            "canned": route.canned is not None,
+            "cold_us": per_call_us(lambda: uncached(message), args.repeat),
+            "warm_us": per_call_us(lambda: route_message(message), args.repeat),
+        })
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""On-disk inverted index with BM25 scoring.
+
+Rows line up with the NumPy vector index of the same snapshot. Layout:
+    bm25.json          vocabulary {term: [df, offset]} plus corpus statistics
+    postings_rows.npy  row ids of every posting, grouped by term
+    postings_tf.npy    term frequency of every posting
+    doc_lengths.npy    token count of every row
+"""
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+
+META_FILE = "bm25.json"
+ROWS_FILE = "postings_rows.npy"
+TF_FILE = "postings_tf.npy"
+LENGTHS_FILE = "doc_lengths.npy"
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:['-][a-z0-9]+)*|[\u0c00-\u0c7f]+")
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have how i in is it its may me my of on or
+should that the their there these they this to was what when where which who why will with you your
+""".split())
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25IndexWriter:
+    """Collect documents in row order and write the inverted index on close()"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._postings = defaultdict(list)
+        self._lengths = []
+
+    def add(self, texts):
+        for text in texts:
+            row = len(self._lengths)
+            counts = Counter(tokenize(text))
+            self._lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self._postings[term].append((row, tf))
+
+    def close(self):
+        vocabulary = {}
+        rows, tfs = [], []
+        for term in sorted(self._postings):
+            postings = self._postings[term]
+            vocabulary[term] = [len(postings), len(rows)]
+            rows.extend(row for row, _ in postings)
+            tfs.extend(min(tf, 65535) for _, tf in postings)
+
+        np.save(os.path.join(self.directory, ROWS_FILE), np.asarray(rows, dtype=np.int32))
+        np.save(os.path.join(self.directory, TF_FILE), np.asarray(tfs, dtype=np.uint16))
+        np.save(os.path.join(self.directory, LENGTHS_FILE), np.asarray(self._lengths, dtype=np.int32))
+        lengths = self._lengths or [0]
+        with open(os.path.join(self.directory, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "documents": len(self._lengths),
+                "avg_length": sum(lengths) / len(lengths),
+                "vocabulary": vocabulary,
+            }, f, ensure_ascii=False)
+
+
+class BM25Index:
+    """Okapi BM25 over a memory-mapped inverted index"""
+
+    def __init__(self, directory, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        with open(os.path.join(directory, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.documents = meta["documents"]
+        self.avg_length = meta["avg_length"] or 1.0
+        self.vocabulary = meta["vocabulary"]
+        self.rows = np.load(os.path.join(directory, ROWS_FILE), mmap_mode="r")
+        self.tfs = np.load(os.path.join(directory, TF_FILE), mmap_mode="r")
+        lengths = np.load(os.path.join(directory, LENGTHS_FILE))
+        # Per-row length normalization is fixed, so precompute it once
+        self._norm = (self.k1 * (1 - self.b + self.b * lengths / self.avg_length)).astype(np.float32)
+
+    def scores(self, query):
+        """Dense BM25 score of query against every row"""
+        scores = np.zeros(self.documents, dtype=np.float32)
+        for term in set(tokenize(query)):
+            entry = self.vocabulary.get(term)
+            if entry is None:
+                continue
+            df, offset = entry
+            idf = math.log(1 + (self.documents - df + 0.5) / (df + 0.5))
+            rows = self.rows[offset:offset + df]
+            tf = self.tfs[offset:offset + df].astype(np.float32)
+            scores[rows] += idf * tf * (self.k1 + 1) / (tf + self._norm[rows])
+        return scores
+
+    def search(self, query, k):
+        """Top-k (row, score) pairs with a positive score, best first"""
+        scores = self.scores(query)
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
@@ -0,0 +1,306 @@
+"""Offline retrieval index builder.
+
+Extracts PDF pages in parallel, splits them into chunks as a stream, embeds
+chunks in large batches and writes a new versioned snapshot (a Chroma store,
+a memory-mapped NumPy index and a BM25 inverted index over the same chunks)
+under the index root. Chunks are content-hashed, so a rebuild reuses the embeddings of
+unchanged chunks from the current snapshot and only embeds new text.
+
+Usage:
+    python build_index.py
+    python build_index.py --source "A-Z Family Medical Encyclopedia.pdf" --source extra.pdf
+"""
+import argparse
+import hashlib
+import logging
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+
+import index_store
+from embedders import BACKENDS, load_embeddings
+from bm25_index import BM25IndexWriter
+from numpy_index import NumpyIndexWriter
+from title_index import TitleIndexWriter
+
+logger = logging.getLogger("build_index")
+
+DEFAULT_SOURCES = ["A-Z Family Medical Encyclopedia.pdf"]
+HEADING_MARK = "\x1e"
+
+
+def _page_count(path):
+    import fitz
+    with fitz.open(path) as pdf:
+        return pdf.page_count
+
+
+def _page_text_with_headings(page):
+    """Page text with short all-bold lines (encyclopedia entry headings) marked"""
+    lines = []
+    for block in page.get_text("dict")["blocks"]:
+        for line in block.get("lines", []):
+            spans = [span for span in line["spans"] if span["text"].strip()]
+            if not spans:
+                continue
+            text = "".join(span["text"] for span in line["spans"]).strip()
+            bold = all(span["flags"] & 16 for span in spans)
+            if bold and len(text) <= 60 and text[:1].isalpha():
+                lines.append(HEADING_MARK + text)
+            else:
+                lines.append(text)
+    return "\n".join(lines)
+
+
+def _extract_pages(args):
+    """Worker: extract the text of pages [start, stop) of one PDF"""
+    import fitz
+    path, start, stop, mark_headings = args
+    with fitz.open(path) as pdf:
+        if mark_headings:
+            return [(number, _page_text_with_headings(pdf[number])) for number in range(start, stop)]
+        return [(number, pdf[number].get_text()) for number in range(start, stop)]
+
+
+def iter_pages(path, pool, pages_per_task=16, lookahead=8, mark_headings=False):
+    """Yield (page_number, text) in order while worker processes extract a bounded window ahead"""
+    count = _page_count(path)
+    pending = deque()
+    for start in range(0, count, pages_per_task):
+        task = (path, start, min(start + pages_per_task, count), mark_headings)
+        pending.append(pool.submit(_extract_pages, task))
+        if len(pending) >= lookahead:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+
+def _splitter(chunk_size, chunk_overlap):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        is_separator_regex=False,
+    )
+
+
+def iter_chunks(pages, chunk_size=1000, chunk_overlap=50):
+    """Split a page stream into (page, chunk, title) without holding the whole document in memory"""
+    splitter = _splitter(chunk_size, chunk_overlap)
+    carry = ""
+    page_number = 0
+    for page_number, text in pages:
+        buffer = f"{carry}\n{text}" if carry else text
+        chunks = splitter.split_text(buffer)
+        if not chunks:
+            continue
+        # The last chunk may continue on the next page, so keep it for the next round
+        for chunk in chunks[:-1]:
+            yield page_number, chunk, None
+        carry = chunks[-1]
+    if carry:
+        yield page_number, carry, None
+
+
+def iter_entry_chunks(pages, chunk_size=1000, chunk_overlap=50):
+    """Split a heading-marked page stream on entry boundaries.
+
+    Each entry is chunked on its own and every chunk is prefixed with the
+    entry title, so no chunk mixes two entries.
+    """
+    splitter = _splitter(chunk_size, chunk_overlap)
+    title, body, start_page = None, [], 0
+
+    def flush():
+        text = "\n".join(body).strip()
+        if not text:
+            return
+        for chunk in splitter.split_text(text):
+            yield start_page, f"{title}\n{chunk}" if title else chunk, title
+
+    for page_number, text in pages:
+        for line in text.split("\n"):
+            if line.startswith(HEADING_MARK):
+                yield from flush()
+                title, body, start_page = line[1:].strip(), [], page_number
+            else:
+                body.append(line)
+    yield from flush()
+
+
+def chunk_id(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _open_collection(path, create=False):
+    import chromadb
+    client = chromadb.PersistentClient(path=path)
+    if create:
+        return client.get_or_create_collection(index_store.COLLECTION_NAME)
+    return client.get_collection(index_store.COLLECTION_NAME)
+
+
+def _previous_collection(root, embedder):
+    """The Chroma collection of the current snapshot, if there is one built with the same embedder"""
+    version = index_store.current_version(root)
+    if version is None:
+        return None
+    previous_embedder = index_store.load_manifest(version, root).get("embedder", "torch")
+    if previous_embedder != embedder:
+        logger.info("Current index was embedded with %s, not %s; embedding every chunk", previous_embedder, embedder)
+        return None
+    chroma_path = os.path.join(index_store.version_path(version, root), index_store.CHROMA_DIR)
+    if not os.path.isdir(chroma_path):
+        return None
+    return _open_collection(chroma_path)
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def build(sources, root=None, workers=None, batch_size=256, chunk_size=1000, chunk_overlap=50,
+          vector_dtype="float32", chunking="fixed", activate=True, embedder=None):
+    """Build a new snapshot from sources and return its version"""
+    embedder = embedder or os.environ.get("CHATBOT_EMBEDDER", "torch")
+    root = root or index_store.index_root()
+    started = time.perf_counter()
+    os.makedirs(root, exist_ok=True)
+    version = index_store.next_version(root)
+    target = index_store.version_path(version, root)
+    staging = target + ".partial"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    embeddings = load_embeddings(embedder, batch_size=batch_size)
+    previous = _previous_collection(root, embedder)
+    collection = _open_collection(os.path.join(staging, index_store.CHROMA_DIR), create=True)
+    numpy_writer = NumpyIndexWriter(os.path.join(staging, index_store.NUMPY_DIR), vector_dtype)
+    bm25_writer = BM25IndexWriter(os.path.join(staging, index_store.BM25_DIR))
+    entries = chunking == "entries"
+    title_writer = TitleIndexWriter(os.path.join(staging, index_store.TITLES_DIR)) if entries else None
+    chunker = iter_entry_chunks if entries else iter_chunks
+
+    seen = set()
+    embedded = 0
+    source_info = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for source in sources:
+            name = os.path.basename(source)
+            pages = {"count": 0}
+
+            def unique_chunks():
+                stream = iter_pages(source, pool, mark_headings=entries)
+                for page_number, text, title in chunker(stream, chunk_size, chunk_overlap):
+                    pages["count"] = max(pages["count"], page_number + 1)
+                    cid = chunk_id(text)
+                    if cid not in seen:
+                        seen.add(cid)
+                        if title_writer is not None and title:
+                            title_writer.add(len(seen) - 1, title, text)
+                        yield cid, page_number, text, title
+
+            # Chunks flow through in batches: reuse known embeddings, embed the rest, write
+            for batch in _batched(unique_chunks(), batch_size):
+                ids = [cid for cid, _, _, _ in batch]
+                texts = [text for _, _, text, _ in batch]
+                vectors = {}
+                if previous is not None:
+                    known = previous.get(ids=ids, include=["embeddings"])
+                    vectors.update(zip(known["ids"], known["embeddings"]))
+                missing = [i for i, cid in enumerate(ids) if cid not in vectors]
+                if missing:
+                    for i, vector in zip(missing, embeddings.embed_documents([texts[i] for i in missing])):
+                        vectors[ids[i]] = vector
+                    embedded += len(missing)
+                batch_vectors = [vectors[cid] for cid in ids]
+                metadatas = [
+                    {"source": name, "page": page_number, **({"title": title} if title else {})}
+                    for _, page_number, _, title in batch
+                ]
+                collection.add(ids=ids, embeddings=batch_vectors, documents=texts, metadatas=metadatas)
+                numpy_writer.add(ids, batch_vectors, texts, metadatas)
+                bm25_writer.add(texts)
+
+            source_info.append({"path": name, "sha256": file_sha256(source), "pages": pages["count"]})
+            logger.info("Indexed %s (%d pages)", name, pages["count"])
+
+    numpy_writer.close()
+    bm25_writer.close()
+    if title_writer is not None:
+        title_writer.close()
+    logger.info("%d unique chunks, %d embedded, %d reused", len(seen), embedded, len(seen) - embedded)
+    index_store.write_manifest(os.path.basename(staging), {
+        "version": version,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "embedding_model": index_store.EMBEDDING_MODEL,
+        "embedder": embedder,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "chunking": chunking,
+        "chunks": len(seen),
+        "vector_dtype": vector_dtype,
+        "embedded": embedded,
+        "sources": source_info,
+    }, root)
+    os.replace(staging, target)
+    if activate:
+        index_store.set_current(version, root)
+
+    logger.info("Built index %s in %.1fs", version, time.perf_counter() - started)
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a versioned retrieval index from PDFs")
+    parser.add_argument("--source", action="append", help="PDF to index (repeatable)")
+    parser.add_argument("--root", default=None, help="Index root directory (default: CHATBOT_INDEX_DIR or ./indexes)")
+    parser.add_argument("--workers", type=int, default=None, help="Page extraction processes")
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks per embedding batch")
+    parser.add_argument("--vector-dtype", choices=["float32", "float16", "int8"], default="float32",
+                        help="Storage type of the memory-mapped NumPy vectors")
+    parser.add_argument("--chunking", choices=["fixed", "entries"], default="fixed",
+                        help="fixed-size chunks, or split on encyclopedia entry headings and build a title index")
+    parser.add_argument("--no-activate", action="store_true", help="Build without updating CURRENT")
+    parser.add_argument("--embedder", choices=BACKENDS, default=None,
+                        help="Embedding backend (default: CHATBOT_EMBEDDER or torch)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    version = build(
+        args.source or DEFAULT_SOURCES,
+        root=args.root,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        vector_dtype=args.vector_dtype,
+        chunking=args.chunking,
+        activate=not args.no_activate,
+        embedder=args.embedder,
+    )
+    print(version)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,252 +1,726 @@
-import sys
-import io
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')  # Telugu output fix
-
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-import os
-from dotenv import load_dotenv
-from langchain_community.chat_message_histories import ChatMessageHistory
-from langchain.memory import ConversationBufferMemory
-from langchain_together import ChatTogether
-from langchain_community.vectorstores import Chroma
-from langdetect import detect
-from langchain_core.messages import HumanMessage, SystemMessage
-import re
-
-class MedicalAssistant:
-    def __init__(self):
-        """Initialize the Medical Assistant with all required components"""
-        # Load environment variables
-        load_dotenv()
-        self.TOGETHER_API_KEY = os.environ.get('TOGETHER_API_KEY')
-        
-        # Initialize components
-        self._setup_vectorstore()   # Only loads/creates once
-        self._setup_llms()
-        self._setup_memory()
-        
-        # Telugu transliteration patterns
-        self.telugu_patterns = [
-            r'\b(ela|ela unnav|em cheyali|em chesav|baagunnava|eppudu|ekkada|entha|enduku)\b',
-            r'\b(nenu|meeru|memu|vaaru|iddaru|mana|mi|na)\b',
-            r'\b(cheppu|cheppandi|help|kavali|undi|ledhu|avunu|kadhu)\b'
-        ]
-    
-    def _load_documents(self):
-        """Load and process the medical encyclopedia"""
-        document = PyMuPDFLoader(file_path=r"A-Z Family Medical Encyclopedia.pdf", mode='single')
-        docs = document.load()
-
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=50,
-            length_function=len,
-            is_separator_regex=False,
-        )
-
-        text_data = [doc.page_content for doc in docs]
-        return text_splitter.create_documents(text_data)
-    
-    def _setup_vectorstore(self):
-        """Setup or load vector store for document retrieval"""
-        embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        chroma_db_path = "chroma_db2"
-
-        if os.path.exists(chroma_db_path):
-            self.vectorstore = Chroma(
-                persist_directory=chroma_db_path,
-                embedding_function=embeddings
-            )
-        else:
-            texts = self._load_documents()
-            self.vectorstore = Chroma.from_documents(
-                texts,
-                embeddings,
-                persist_directory=chroma_db_path
-            )
-            self.vectorstore.persist()
-
-        self.retriever = self.vectorstore.as_retriever(search_kwargs={"k": 5})
-    
-    def _setup_llms(self):
-        """Setup both small & big LLMs"""
-        # Large, accurate model for medical Qs
-        self.llm_medical = ChatTogether(
-            together_api_key=self.TOGETHER_API_KEY,
-            model="meta-llama/Meta-Llama-3.1-70B-Instruct-Turbo",
-            max_tokens=500
-    )
-        # Small, fast model for greetings/casual Qs
-        self.llm_fast = ChatTogether(
-            together_api_key=self.TOGETHER_API_KEY,
-            model="meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo",
-            max_tokens=200
-    )
-    
-    def _setup_memory(self):
-        """Setup conversation memory"""
-        message_history = ChatMessageHistory()
-        self.memory = ConversationBufferMemory(
-            chat_memory=message_history,
-            memory_key="chat_history",
-            input_key="question",
-            output_key="answer",
-            return_messages=True,
-            human_prefix="Human",
-            ai_prefix="AI",
-        )
-    
-    def _detect_language_enhanced(self, text):
-        """Enhanced language detection including transliterated Telugu"""
-        try:
-            detected = detect(text)
-            if detected == 'te':
-                return 'te'
-        except:
-            pass
-        
-        text_lower = text.lower()
-        for pattern in self.telugu_patterns:
-            if re.search(pattern, text_lower):
-                return 'te_transliterated'
-        
-        return 'en'
-    
-    def _is_greeting_or_casual(self, text):
-        """Check if the input is a greeting or casual conversation"""
-        casual_patterns = [
-            r'\b(hi|hello|hey|hola|namaste|vanakkam)\b',
-            r'\b(how are you|how r u|whats up|sup|wassup)\b',
-            r'\b(good morning|good evening|good afternoon)\b',
-            r'\b(ela unnav|ela unnaav|baagunnava|ela undi)\b',
-            r'\b(thank you|thanks|bye|goodbye|see you)\b'
-        ]
-        
-        text_lower = text.lower().strip()
-        for pattern in casual_patterns:
-            if re.search(pattern, text_lower):
-                return True
-        
-        return len(text_lower.split()) <= 3 and any(word in text_lower for word in ['hi', 'hello', 'hey', 'ela'])
-    
-    def _build_dynamic_prompt(self, user_input, chat_history, context, language):
-        """Build language-specific prompts"""
-        if language in ['te', 'te_transliterated']:
-            return f"""
-మీరు ఒక జ్ఞానపూర్వక AI వైద్య సహాయకుడిగా వ్యవహరించాలి. 
-ఎల్లప్పుడూ తెలుగు లో స్పష్టంగా మరియు స్నేహపూర్వకంగా సమాధానం ఇవ్వండి. 
-సమాధానం చిన్నదిగా (1-2 వాక్యాలు) కానీ అర్థవంతంగా ఉండాలి.
-
-మునుపటి సంభాషణ:
-{chat_history}
-
-ప్రశ్న:
-{user_input}
-
-పత్రాల నుండి సందర్భ సమాచారం:
-{context}
-
-సూచనలు:
-- తెలుగు లోనే సమాధానం ఇవ్వాలి.  
-- సమాధానం చిన్నదిగా (1-2 వాక్యాలు) కానీ పూర్తిగా ఉండాలి.
-- ఎప్పుడూ వాక్యం మధ్యలో ఆపకండి
-- క్లిష్ట పదాలను సులభంగా వివరించాలి.  
-
-మీ సమాధానం:
-"""
-        else:
-            return f"""
-You are a knowledgeable AI medical assistant. 
-Always reply clearly in English. 
-Keep the answer short (1-2 sentences) but meaningful.
-
-Previous conversation:
-{chat_history}
-
-Question:
-{user_input}
-
-Context information from documents:
-{context}
-
-Instructions:
-- Answer only in English.  
-- Keep the answer short (1-2 sentences) but complete. 
-- Never stop in the middle of a sentence.
-- Explain complex medical terms in simple words.  
-
-Your Answer:
-"""
-    
-    def get_chatbot_response(self, text: str) -> str:
-        """Main chatbot function for frontend integration"""
-        try:
-            language = self._detect_language_enhanced(text)
-            
-            # For greetings/casual → use fast small model
-            if self._is_greeting_or_casual(text):
-                result = self.llm_fast.invoke([HumanMessage(content=text)])
-                response = result.content
-                self.memory.save_context({"question": text}, {"answer": response})
-                return response
-            
-            # For medical questions → use big model + vectorstore
-            docs = self.retriever.invoke(text)
-            context = "\n\n".join([doc.page_content for doc in docs])
-            
-            dynamic_prompt = self._build_dynamic_prompt(text, self.memory.buffer_as_str, context, language)
-
-            result = self.llm_medical.invoke([
-                SystemMessage(content=dynamic_prompt),
-                HumanMessage(content=text)
-            ])
-
-            self.memory.save_context({"question": text}, {"answer": result.content})
-            return result.content
-
-        except Exception:
-            if language in ['te', 'te_transliterated']:
-                return "క్షమించండి, మీ ప్రశ్నను ప్రాసెస్ చేయలేకపోయాను. మరోసారి ప్రయత్నించండి."
-            else:
-                return "I'm sorry, I couldn't process your request. Please try again."
-    
-    def clear_conversation_history(self):
-        self.memory.clear()
-    
-    def get_conversation_history(self):
-        return self.memory.buffer_as_str
-
-# Global instance
-medical_assistant = None
-
-def initialize_medical_assistant():
-    global medical_assistant
-    if medical_assistant is None:
-        medical_assistant = MedicalAssistant()
-    return medical_assistant
-
-def get_chatbot_response(text: str) -> str:
-    global medical_assistant
-    if medical_assistant is None:
-        medical_assistant = initialize_medical_assistant()
-    return medical_assistant.get_chatbot_response(text)
-
-def clear_chat_history():
-    global medical_assistant
-    if medical_assistant:
-        medical_assistant.clear_conversation_history()
-  
-        
-if __name__ == "__main__":
-    assistant = initialize_medical_assistant()
-
-    print("Medical Assistant is ready! Type your question (or 'quit' to exit):")
-    while True:
-        user_input = input("You: ")
-        if user_input.lower() in ["quit", "exit", "bye"]:
-            print("Assistant: Goodbye! Stay healthy.")
-            break
-        response = assistant.get_chatbot_response(user_input)
-        print("Assistant:", response)
+import sys
+import io
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')  # Telugu output fix
+
+# langchain_huggingface (torch) and langchain_together (openai) are imported where
+# they are first needed (see embedders.py), so importing this module stays fast
+import os
+from dotenv import load_dotenv
+from langchain_core.messages import HumanMessage, SystemMessage
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import httpx
+import threading
+import logging
+import time
+import index_store
+from retrievers import FORK_SAFE_BACKENDS, ChromaRetriever, configured_backend, open_retriever
+from history_store import HistoryStore
+from session_store import SessionStore
+from history import HistoryManager, estimate_tokens
+from router import normalize_question, route_message
+from semantic_cache import SemanticCache, is_history_dependent
+from single_flight import SingleFlight
+from snapshot_manager import Snapshot, SnapshotManager
+from embedding_batcher import EmbeddingBatcher
+from embedders import load_embeddings
+from context_compression import compress_context
+from prompts import system_prompt
+from llm_policy import BudgetedLLM, CircuitBreaker
+from metrics import observe_request, record_error, span
+
+logger = logging.getLogger(__name__)
+
+# Unversioned store written by older releases, still opened read-only if present
+LEGACY_CHROMA_PATH = "chroma_db2"
+TOGETHER_BASE_URL = "https://api.together.xyz"
+
+def open_index(embeddings):
+    """(retriever, version) for the CURRENT index snapshot, or the legacy Chroma store"""
+    version = index_store.current_version()
+    if version is not None:
+        return open_retriever(index_store.version_path(version), embeddings), version
+    if os.path.exists(LEGACY_CHROMA_PATH):
+        logger.warning("No versioned index found, opening legacy store %s", LEGACY_CHROMA_PATH)
+        return ChromaRetriever(LEGACY_CHROMA_PATH, embeddings), None
+    raise RuntimeError(
+        f"No prebuilt index under {index_store.index_root()!r}; run `python build_index.py` first"
+    )
+
+class _PreparedTurn:
+    """State carried from prompt assembly to the LLM call"""
+    __slots__ = ("language", "llm", "messages", "vector", "cacheable", "answer", "served_by")
+
+    def __init__(self):
+        self.language = 'en'
+        self.llm = None
+        self.messages = None
+        self.vector = None
+        self.cacheable = False
+        self.answer = None
+        self.served_by = None
+
+class MedicalAssistant:
+    def __init__(self, embeddings=None, retriever=None, llm_medical=None, llm_fast=None, index_version=None):
+        """Initialize the Medical Assistant with all required components.
+
+        Any component passed in is used as is instead of being built from the
+        environment (benchmarks and tests use this for local stand-ins, the
+        gunicorn master for components preloaded before forking workers).
+        """
+        # Load environment variables
+        load_dotenv()
+        self.TOGETHER_API_KEY = os.environ.get('TOGETHER_API_KEY')
+
+        # Per-worker limits: concurrent requests in the async pipeline and
+        # threads available for blocking work (embedding, search, language detection)
+        self.max_concurrency = int(os.environ.get('CHATBOT_MAX_CONCURRENCY', '8'))
+        self.batch_concurrency = int(os.environ.get('CHATBOT_BATCH_CONCURRENCY', '4'))
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(os.environ.get('CHATBOT_EXECUTOR_WORKERS', '4')),
+            thread_name_prefix="chatbot",
+        )
+        self._semaphore = None
+        self._cli_loop = None
+        
+        # Initialize components; per-phase timings end up in self.startup["timings_ms"]
+        self.startup = {}
+        self._setup_vectorstore(embeddings, retriever, index_version)   # Only loads/creates once
+        with span(self.startup, "llm_clients"):
+            self._setup_llms(llm_medical, llm_fast)
+        self._setup_memory()
+        with span(self.startup, "answer_cache"):
+            self._setup_cache()
+    
+    def _setup_vectorstore(self, embeddings=None, retriever=None, index_version=None):
+        """Open the prebuilt retrieval index (see build_index.py and retrievers.py)"""
+        if embeddings is None:
+            with span(self.startup, "embedder"):
+                embeddings = load_embeddings()
+        self.embeddings = embeddings
+        # Queries from concurrent requests are embedded together; CHATBOT_EMBED_BATCH_SIZE=1 turns this off
+        batch_size = int(os.environ.get('CHATBOT_EMBED_BATCH_SIZE', '32'))
+        self.embed_batcher = EmbeddingBatcher(
+            embeddings.embed_documents,
+            self.executor,
+            max_batch=batch_size,
+            max_wait_seconds=float(os.environ.get('CHATBOT_EMBED_BATCH_WAIT_MS', '3')) / 1000,
+        ) if batch_size > 1 else None
+        self.retriever_k = 5
+        # Retrieved chunks are cut down to their relevant sentences within a token budget,
+        # smaller when the title index matched the question to its encyclopedia entry
+        self.compress = os.environ.get('CHATBOT_CONTEXT_COMPRESSION', '1') == '1'
+        self.context_budgets = {
+            "search": int(os.environ.get('CHATBOT_CONTEXT_TOKENS', '400')),
+            "title": int(os.environ.get('CHATBOT_CONTEXT_TOKENS_TITLE', '300')),
+        }
+        if retriever is None:
+            with span(self.startup, "index"):
+                retriever, index_version = open_index(embeddings)
+
+        # Searches go through the snapshot manager so a new index version can be swapped in live
+        self.snapshots = SnapshotManager(
+            lambda version: open_retriever(index_store.version_path(version), embeddings),
+            embeddings,
+            self._run_blocking,
+            Snapshot(index_version, retriever),
+            # Cached answers came from the old corpus
+            on_swap=lambda: self.answer_cache.clear(),
+        )
+
+    @property
+    def retriever(self):
+        """Retriever of the snapshot currently being served"""
+        return self.snapshots.current.retriever
+
+    @property
+    def index_version(self):
+        return self.snapshots.version
+    
+    def _setup_llms(self, llm_medical=None, llm_fast=None):
+        """Setup both small & big LLMs behind one pooled HTTP client and a latency budget"""
+        budget = float(os.environ.get('CHATBOT_LLM_BUDGET', '20'))
+        self.http_client = self.http_async_client = None
+        if llm_medical is None or llm_fast is None:
+            from langchain_together import ChatTogether
+
+            limits = httpx.Limits(
+                max_connections=int(os.environ.get('CHATBOT_HTTP_MAX_CONNECTIONS', '50')),
+                max_keepalive_connections=int(os.environ.get('CHATBOT_HTTP_KEEPALIVE', '20')),
+                keepalive_expiry=60,
+            )
+            timeout = httpx.Timeout(budget, connect=5.0)
+            # Both models talk to the same API host, so they share keep-alive connections
+            self.http_client = httpx.Client(limits=limits, timeout=timeout)
+            self.http_async_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+            clients = dict(
+                together_api_key=self.TOGETHER_API_KEY,
+                http_client=self.http_client,
+                http_async_client=self.http_async_client,
+                timeout=budget,
+                max_retries=0,  # retries are budgeted by BudgetedLLM
+            )
+
+        # Large, accurate model for medical Qs
+        self.llm_medical = llm_medical or ChatTogether(
+            model="meta-llama/Meta-Llama-3.1-70B-Instruct-Turbo",
+            max_tokens=500,
+            **clients
+    )
+        # Small, fast model for greetings/casual Qs
+        self.llm_fast = llm_fast or ChatTogether(
+            model="meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo",
+            max_tokens=200,
+            **clients
+    )
+        self.llm = BudgetedLLM(
+            self.llm_medical,
+            self.llm_fast,
+            budget_seconds=budget,
+            hedge_seconds=float(os.environ.get('CHATBOT_LLM_HEDGE_AFTER', '12')),
+            retries=int(os.environ.get('CHATBOT_LLM_RETRIES', '1')),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.environ.get('CHATBOT_BREAKER_FAILURES', '5')),
+                reset_seconds=float(os.environ.get('CHATBOT_BREAKER_RESET', '30')),
+            ),
+        )
+    
+    def _setup_memory(self):
+        """Setup per-user conversation sessions"""
+        # Durable history shared by all workers (CHATBOT_HISTORY_DB= keeps sessions in memory only)
+        history_db = os.environ.get('CHATBOT_HISTORY_DB', 'history.sqlite3')
+        backend = HistoryStore(
+            history_db,
+            flush_seconds=float(os.environ.get('CHATBOT_HISTORY_FLUSH_MS', '50')) / 1000,
+            compact_seconds=float(os.environ.get('CHATBOT_HISTORY_COMPACT_SECONDS', '3600')),
+            retention_seconds=float(os.environ.get('CHATBOT_HISTORY_RETENTION_DAYS', '30')) * 86400,
+        ) if history_db else None
+        # In-memory window over the durable history
+        self.sessions = SessionStore(
+            max_sessions=int(os.environ.get('CHATBOT_MAX_SESSIONS', '1000')),
+            ttl_seconds=int(os.environ.get('CHATBOT_SESSION_TTL', '1800')),
+            max_turns=int(os.environ.get('CHATBOT_SESSION_TURNS', '20')),
+            max_bytes=int(os.environ.get('CHATBOT_SESSION_MAX_BYTES', str(64 * 1024 * 1024))),
+            backend=backend,
+        )
+        # Recent turns stay verbatim within a token budget; older ones are summarized by llm_fast
+        self.history = HistoryManager(
+            self.sessions,
+            self.llm_fast,
+            max_turns=int(os.environ.get('CHATBOT_HISTORY_TURNS', '6')),
+            token_budget=int(os.environ.get('CHATBOT_HISTORY_TOKENS', '600')),
+        )
+
+    def _setup_cache(self):
+        """Setup the semantic answer cache in front of the medical model"""
+        self.answer_cache = SemanticCache(
+            dim=len(self.embeddings.embed_query("dimension probe")),
+            max_entries=int(os.environ.get('CHATBOT_CACHE_SIZE', '2000')),
+            threshold=float(os.environ.get('CHATBOT_CACHE_THRESHOLD', '0.9')),
+            ttl_seconds=int(os.environ.get('CHATBOT_CACHE_TTL', str(24 * 3600))),
+        )
+        # Identical questions in flight at the same time share one answer
+        self.flights = SingleFlight()
+
+    async def awarm_up(self):
+        """Run each stage once so the first real request does not pay for lazy initialization"""
+        question = "What are the symptoms of fever?"
+        with span(self.startup, "warmup_embed"):
+            vector = await self._aembed(question)
+        with span(self.startup, "warmup_retrieve"):
+            await self._aretrieve(question, vector)
+        route_message(question)
+        if self.http_async_client is not None:
+            # Open the TLS connection the first model call would otherwise set up
+            with span(self.startup, "warmup_llm_pool"):
+                try:
+                    await self.http_async_client.head(TOGETHER_BASE_URL, timeout=5.0)
+                except Exception as exc:
+                    logger.warning("Could not pre-open the model API connection: %r", exc)
+        return self.startup["timings_ms"]
+
+    async def _asave_turn(self, session_id, question, answer, stats):
+        """Record a turn for the session (anonymous requests are not remembered)"""
+        if not session_id:
+            return
+        try:
+            # May load the session from disk, so off the event loop
+            session = await self._run_blocking(self.sessions.append, session_id, question, answer)
+            self.history.compact(session)
+        except Exception as exc:
+            # The answer is already written; losing the turn must not fail the request
+            stats.setdefault("failed_stage", "save_turn")
+            record_error(stats, exc)
+            logger.exception("Could not save the turn for session %s", session_id)
+    
+    async def _run_blocking(self, func, *args):
+        """Run a blocking call on the bounded executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args))
+
+    async def _aembed(self, text, stats=None):
+        """Embed the query off the event loop, batched with other requests' queries"""
+        if self.embed_batcher is not None:
+            return await self.embed_batcher.embed(text, stats)
+        return await self._run_blocking(self.embeddings.embed_query, text)
+
+    async def _aretrieve(self, text, vector):
+        """Search the serving index snapshot off the event loop"""
+        with self.snapshots.acquire() as snapshot:
+            return await self._run_blocking(snapshot.retriever.search, text, vector, self.retriever_k)
+
+    def _build_context(self, text, docs, stats):
+        """Context block for the prompt from the retrieved chunks"""
+        texts = [doc.page_content for doc in docs]
+        if not self.compress:
+            return "\n\n".join(texts)
+        route = "title" if docs and docs[0].metadata.get("match") in ("title", "fuzzy_title") else "search"
+        with span(stats, "compress"):
+            context, info = compress_context(text, texts, self.context_budgets[route])
+        for key, value in info.items():
+            stats[key] = stats.get(key, 0) + value
+        return context
+
+    def _error_reply(self, language):
+        if language in ['te', 'te_transliterated']:
+            return "క్షమించండి, మీ ప్రశ్నను ప్రాసెస్ చేయలేకపోయాను. మరోసారి ప్రయత్నించండి."
+        else:
+            return "I'm sorry, I couldn't process your request. Please try again."
+
+    def _acquire_slot(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _aprepare(self, text, session_id, stats, prepared):
+        """Run everything before the LLM call: routing, cache, retrieval and prompt assembly"""
+        with span(stats, "route"):
+            route = route_message(text)
+        prepared.language = route.language
+
+        # Pure greetings/thanks/goodbyes → canned reply, no model call
+        if route.canned:
+            stats["route"] = stats["served_by"] = "canned"
+            prepared.answer = route.canned
+            return prepared
+
+        # Other casual messages → fast small model
+        if route.is_casual:
+            stats["route"] = "fast"
+            prepared.llm = self.llm_fast
+            prepared.messages = [HumanMessage(content=text)]
+            return prepared
+
+        # For medical questions → use big model + vectorstore
+        stats["route"] = "medical"
+        session = await self._run_blocking(self.sessions.get, session_id) if session_id else None
+        with span(stats, "embed"):
+            prepared.vector = await self._aembed(text, stats)
+
+        # Follow-ups like "is it contagious?" depend on history, so never share answers for them
+        prepared.cacheable = not is_history_dependent(text, bool(session and session.turns))
+        if prepared.cacheable:
+            with span(stats, "cache"):
+                prepared.answer = self.answer_cache.lookup(prepared.vector, prepared.language)
+            stats["cache"] = "hit" if prepared.answer is not None else "miss"
+            if prepared.answer is not None:
+                stats["served_by"] = "cache"
+                return prepared
+        else:
+            self.answer_cache.record_bypass()
+            stats["cache"] = "bypass"
+
+        with span(stats, "retrieve"):
+            docs = await self._aretrieve(text, prepared.vector)
+        stats["retrieval"] = docs[0].metadata.get("match", self.retriever.name) if docs else "none"
+        context = await self._run_blocking(self._build_context, text, docs, stats)
+
+        with span(stats, "prompt"):
+            chat_history = self.history.render(session, stats) if session else ""
+            prompt = system_prompt(prepared.language, context, chat_history)
+        # An answer written with this user's history in the prompt must not be served to other users
+        prepared.cacheable = prepared.cacheable and not chat_history
+        stats["prompt_tokens_estimate"] = estimate_tokens(prompt) + estimate_tokens(text)
+
+        prepared.llm = self.llm_medical
+        prepared.messages = [
+            SystemMessage(content=prompt),
+            HumanMessage(content=text)
+        ]
+        return prepared
+
+    def _cache_answer(self, prepared, answer):
+        # Fallback answers from the fast model are not worth reusing
+        if prepared.cacheable and prepared.served_by == "medical":
+            self.answer_cache.store(prepared.vector, prepared.language, answer)
+
+    async def _afinish(self, text, session_id, prepared, answer, stats):
+        """Remember a completed answer in the session and the answer cache"""
+        self._cache_answer(prepared, answer)
+        await self._asave_turn(session_id, text, answer, stats)
+
+    async def _aflight_key(self, text, session_id, language):
+        """Questions that must get the same answer: same wording, language and visible history"""
+        # Resolved like _aprepare does, so history only on disk (or newer there) is part of the key
+        session = await self._run_blocking(self.sessions.get, session_id) if session_id else None
+        history = self.history.render(session) if session else ""
+        return normalize_question(text), language, hash(history)
+
+    async def _ainvoke(self, prepared, stats):
+        """Call the model chosen for this turn under the latency budget"""
+        with span(stats, "llm"):
+            if prepared.llm is self.llm_medical:
+                answer = await self.llm.ainvoke(prepared.messages, stats)
+            else:
+                answer = await self.llm.ainvoke_fast(prepared.messages, stats)
+        prepared.served_by = stats.get("served_by")
+        self._count_tokens(prepared, stats, answer)
+        return answer
+
+    @staticmethod
+    def _count_tokens(prepared, stats, answer):
+        """Token counts from the API's usage report, estimated when it has none"""
+        if stats.get("prompt_tokens") is None:
+            stats["prompt_tokens"] = sum(estimate_tokens(m.content) for m in prepared.messages)
+        if stats.get("completion_tokens") is None:
+            stats["completion_tokens"] = estimate_tokens(answer)
+
+    async def _atimed_slot(self, stats):
+        with span(stats, "slot_wait"):
+            await self._acquire_slot().acquire()
+
+    async def _aanswer(self, text, session_id):
+        """Prepare and answer one question; the unit of work shared by coalesced requests"""
+        stats = {}
+        prepared = _PreparedTurn()
+        await self._atimed_slot(stats)
+        try:
+            await self._aprepare(text, session_id, stats, prepared)
+            if prepared.answer is None:
+                prepared.answer = await self._ainvoke(prepared, stats)
+                self._cache_answer(prepared, prepared.answer)
+        except Exception as exc:
+            # Logged once here, however many coalesced requests were waiting on it
+            record_error(stats, exc)
+            logger.exception("Answering failed in stage %s", stats.get("failed_stage", "unknown"))
+            raise
+        finally:
+            self._acquire_slot().release()
+        return prepared.answer, stats
+
+    async def _aretrieve_batch(self, texts, vectors):
+        with self.snapshots.acquire() as snapshot:
+            return await self._run_blocking(snapshot.retriever.search_batch, texts, vectors, self.retriever_k)
+
+    async def aget_chatbot_response(self, text: str, session_id: str = None, stats: dict = None) -> str:
+        """Async chatbot pipeline used by the API; per-request counters go into stats.
+
+        Identical questions arriving while one is already being answered
+        wait for that answer instead of repeating retrieval and the model call.
+        """
+        if stats is None:
+            stats = {}
+        started = time.perf_counter()
+        language = route_message(text).language
+        key = await self._aflight_key(text, session_id, language)
+        try:
+            (answer, shared_stats), coalesced = await self.flights.run(
+                key, lambda: self._aanswer(text, session_id)
+            )
+        except Exception as exc:
+            stats["error"] = type(exc).__name__
+            answer = self._error_reply(language)
+        else:
+            # Keep timings recorded by the caller (e.g. admission wait) next to the pipeline's own
+            timings = {**stats.get("timings_ms", {}), **shared_stats.get("timings_ms", {})}
+            stats.update(shared_stats)
+            stats["timings_ms"] = timings
+            stats["coalesced"] = coalesced
+            await self._asave_turn(session_id, text, answer, stats)
+        observe_request(stats, time.perf_counter() - started)
+        return answer
+
+    async def astream_chatbot_response(self, text: str, session_id: str = None, stats: dict = None):
+        """Yield the answer in chunks as the model produces them.
+
+        The turn is only saved once the stream completes, so a client that
+        disconnects midway leaves no half answer in its session.
+        """
+        if stats is None:
+            stats = {}
+        started = time.perf_counter()
+        prepared = _PreparedTurn()
+        await self._atimed_slot(stats)
+        try:
+            try:
+                await self._aprepare(text, session_id, stats, prepared)
+            except Exception as exc:
+                record_error(stats, exc)
+                logger.exception("Preparing a streamed answer failed in stage %s", stats.get("failed_stage"))
+                yield self._error_reply(prepared.language)
+                return
+
+            if prepared.answer is not None:
+                await self._asave_turn(session_id, text, prepared.answer, stats)
+                yield prepared.answer
+                return
+
+            if prepared.llm is self.llm_medical:
+                stream = self.llm.astream(prepared.messages, stats)
+            else:
+                stream = self.llm.astream_fast(prepared.messages, stats)
+            parts = []
+            llm_started = time.perf_counter()
+            try:
+                with span(stats, "llm"):
+                    async for content in stream:
+                        if not parts:
+                            stats.setdefault("timings_ms", {})["first_token"] = (time.perf_counter() - llm_started) * 1000
+                        parts.append(content)
+                        yield content
+            except Exception as exc:
+                if not parts:
+                    yield self._error_reply(prepared.language)
+                record_error(stats, exc)
+                logger.exception("Streaming the answer failed after %d chunks", len(parts))
+                return
+
+            prepared.served_by = stats.get("served_by")
+            answer = "".join(parts)
+            self._count_tokens(prepared, stats, answer)
+            await self._afinish(text, session_id, prepared, answer, stats)
+        finally:
+            self._acquire_slot().release()
+            observe_request(stats, time.perf_counter() - started, kind="stream")
+
+    async def abatch_chatbot_responses(self, texts, stats: dict = None):
+        """Answer many stateless questions with one embedding pass and one vector search.
+
+        Returns one entry per input, in input order: the reply string, or the
+        exception raised while answering that item.
+        """
+        if stats is None:
+            stats = {}
+        started = time.perf_counter()
+        prepared = [_PreparedTurn() for _ in texts]
+
+        medical = []
+        for i, text in enumerate(texts):
+            route = route_message(text)
+            prepared[i].language = route.language
+            if route.canned:
+                prepared[i].answer = route.canned
+            elif route.is_casual:
+                prepared[i].llm = self.llm_fast
+                prepared[i].messages = [HumanMessage(content=text)]
+            else:
+                medical.append(i)
+
+        misses = []
+        if medical:
+            with span(stats, "embed"):
+                vectors = await self._run_blocking(self.embeddings.embed_documents, [texts[i] for i in medical])
+            with span(stats, "cache"):
+                for i, vector in zip(medical, vectors):
+                    item = prepared[i]
+                    item.vector = vector
+                    item.cacheable = True
+                    item.answer = self.answer_cache.lookup(vector, item.language)
+                    if item.answer is None:
+                        misses.append(i)
+
+        if misses:
+            with span(stats, "retrieve"):
+                doc_lists = await self._aretrieve_batch([texts[i] for i in misses], [prepared[i].vector for i in misses])
+            # Compression is CPU work (~1.5 ms a context); all of it in one executor call, not on the loop
+            contexts = await self._run_blocking(
+                lambda: [self._build_context(texts[i], docs, stats) for i, docs in zip(misses, doc_lists)]
+            )
+            for i, context in zip(misses, contexts):
+                item = prepared[i]
+                item.llm = self.llm_medical
+                item.messages = [
+                    SystemMessage(content=system_prompt(item.language, context)),
+                    HumanMessage(content=texts[i])
+                ]
+
+        limit = asyncio.Semaphore(self.batch_concurrency)
+
+        served_by = {}
+
+        async def answer(i):
+            item = prepared[i]
+            if item.answer is not None:
+                return item.answer
+            item_stats = {}
+            try:
+                async with limit, self._acquire_slot():
+                    content = await self._ainvoke(item, item_stats)
+            except Exception as exc:
+                record_error(item_stats, exc)
+                logger.warning("Batch item %d failed: %r", i, exc)
+                raise
+            served_by[item.served_by] = served_by.get(item.served_by, 0) + 1
+            await self._afinish(texts[i], None, item, content, item_stats)
+            return content
+
+        with span(stats, "llm"):
+            results = await asyncio.gather(*(answer(i) for i in range(len(texts))), return_exceptions=True)
+
+        stats["items"] = len(texts)
+        stats["embedded"] = len(medical)
+        stats["cache_hits"] = len(medical) - len(misses)
+        stats["canned"] = sum(1 for item in prepared if item.llm is None and item.vector is None)
+        stats["llm_calls"] = len(texts) - stats["cache_hits"] - stats["canned"]
+        stats["errors"] = sum(1 for r in results if isinstance(r, BaseException))
+        stats["served_by"] = served_by
+        observe_request({"route": "batch", "timings_ms": stats["timings_ms"]}, time.perf_counter() - started, kind="batch")
+        return results
+
+    def get_chatbot_response(self, text: str, session_id: str = None) -> str:
+        """Blocking wrapper around the async pipeline (CLI use only)"""
+        # One loop for the whole CLI session, so pooled connections stay usable
+        if self._cli_loop is None:
+            self._cli_loop = asyncio.new_event_loop()
+        return self._cli_loop.run_until_complete(self.aget_chatbot_response(text, session_id))
+    
+    def clear_conversation_history(self, session_id=None):
+        self.sessions.clear(session_id)
+    
+    def get_conversation_history(self, session_id):
+        session = self.sessions.peek(session_id)
+        return self.history.render(session) if session else ""
+
+# Global instance
+medical_assistant = None
+_init_lock = threading.Lock()
+
+# Read-only components loaded once in the gunicorn master and inherited by every worker
+shared_components = {}
+preload_stats = {}
+
+def preload_shared_components():
+    """Load the embedding model and open the index before gunicorn forks its workers.
+
+    Workers share these pages copy-on-write. Only read-only state is built
+    here: nothing is run through the model (its thread pools would not survive
+    the fork) and executors, HTTP clients, caches and sessions are created per
+    worker when MedicalAssistant is built. The index is preloaded only for
+    the memory-mapped backends; Chroma (and the legacy store) hold SQLite
+    connections that must not cross a fork, so each worker opens its own.
+    """
+    if not shared_components:
+        with span(preload_stats, "embedder"):
+            embeddings = load_embeddings()
+        shared_components.update(embeddings=embeddings)
+        backend = configured_backend()
+        if index_store.current_version() is not None and backend in FORK_SAFE_BACKENDS:
+            with span(preload_stats, "index"):
+                retriever, version = open_index(embeddings)
+            shared_components.update(retriever=retriever, index_version=version)
+        else:
+            logger.warning(
+                "Not preloading the %r index: it is not fork-safe, each worker opens its own "
+                "(CHATBOT_RETRIEVER=numpy or hybrid can be shared)", backend,
+            )
+    return preload_stats["timings_ms"]
+
+def initialize_medical_assistant(**components):
+    """Build the shared assistant once; components are passed to MedicalAssistant"""
+    global medical_assistant
+    with _init_lock:
+        if medical_assistant is None:
+            medical_assistant = MedicalAssistant(**{**shared_components, **components})
+    return medical_assistant
+
+async def awarm_up_medical_assistant(**components):
+    """Build the shared assistant off the event loop and warm it up; returns phase timings in ms"""
+    loop = asyncio.get_running_loop()
+    assistant = await loop.run_in_executor(None, functools.partial(initialize_medical_assistant, **components))
+    return await assistant.awarm_up()
+
+def get_chatbot_response(text: str, session_id: str = None) -> str:
+    global medical_assistant
+    if medical_assistant is None:
+        medical_assistant = initialize_medical_assistant()
+    return medical_assistant.get_chatbot_response(text, session_id)
+
+async def aget_chatbot_response(text: str, session_id: str = None, stats: dict = None) -> str:
+    global medical_assistant
+    if medical_assistant is None:
+        # First call builds the assistant off the event loop
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, initialize_medical_assistant)
+    return await medical_assistant.aget_chatbot_response(text, session_id, stats)
+
+async def abatch_chatbot_responses(texts, stats: dict = None):
+    global medical_assistant
+    if medical_assistant is None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, initialize_medical_assistant)
+    return await medical_assistant.abatch_chatbot_responses(texts, stats)
+
+async def astream_chatbot_response(text: str, session_id: str = None, stats: dict = None):
+    global medical_assistant
+    if medical_assistant is None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, initialize_medical_assistant)
+    async for chunk in medical_assistant.astream_chatbot_response(text, session_id, stats):
+        yield chunk
+
+def clear_chat_history(session_id=None):
+    global medical_assistant
+    if medical_assistant:
+        medical_assistant.clear_conversation_history(session_id)
+
+def get_cache_stats():
+    if medical_assistant is None:
+        return {}
+    return {**medical_assistant.answer_cache.stats(), "coalescing": medical_assistant.flights.stats()}
+
+def get_llm_stats():
+    if medical_assistant is None:
+        return {}
+    return medical_assistant.llm.stats()
+
+def get_embedding_stats():
+    if medical_assistant is None or medical_assistant.embed_batcher is None:
+        return {}
+    return medical_assistant.embed_batcher.stats()
+
+def get_index_status():
+    if medical_assistant is None:
+        return {}
+    return medical_assistant.snapshots.status()
+
+async def aactivate_index(version=None):
+    """Swap to version (default: newest) in this worker; other workers follow CURRENT"""
+    return await medical_assistant.snapshots.activate(version)
+
+async def arollback_index():
+    return await medical_assistant.snapshots.rollback()
+
+async def awatch_index(interval):
+    """Follow CURRENT in this worker once the assistant exists"""
+    while medical_assistant is None:
+        await asyncio.sleep(interval)
+    await medical_assistant.snapshots.watch(interval)
+
+def get_session_stats():
+    if medical_assistant is None:
+        return {}
+    return medical_assistant.sessions.stats()
+  
+        
+if __name__ == "__main__":
+    assistant = initialize_medical_assistant()
+
+    print("Medical Assistant is ready! Type your question (or 'quit' to exit):")
+    while True:
+        user_input = input("You: ")
+        if user_input.lower() in ["quit", "exit", "bye"]:
+            print("Assistant: Goodbye! Stay healthy.")
+            break
+        response = assistant.get_chatbot_response(user_input, session_id="cli")
+        print("Assistant:", response)
@@ -0,0 +1,121 @@
+"""Shrink retrieved chunks to the sentences that matter before they reach the prompt.
+
+Retrieved chunks overlap (the splitter repeats up to chunk_overlap characters
+at each boundary), sometimes repeat whole passages, and are far longer than a
+one-or-two sentence answer needs. compress_context() splits them into
+sentences, drops duplicates and boundary fragments, ranks what is left by
+overlap with the question's terms and packs the best sentences, in document
+order, into a token budget.
+"""
+import math
+import re
+
+from bm25_index import tokenize
+from history import estimate_tokens
+
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+_KEY_RE = re.compile(r"\W+")
+# Shorter sentences only count as repeats when identical, not when contained in another
+MIN_FRAGMENT_CHARS = 20
+
+
+def split_sentences(text):
+    return [s.strip() for s in SENTENCE_RE.split(text) if s and s.strip()]
+
+
+def _key(sentence):
+    # Padded with spaces so containment checks match whole words only
+    return " " + _KEY_RE.sub(" ", sentence.lower()).strip() + " "
+
+
+def _stem(term):
+    # Crude, but "treated" meets "treatment" and "symptoms" meets "symptom"
+    return term[:5] if len(term) > 5 else term.rstrip("s")
+
+
+class _Sentence:
+    __slots__ = ("rank", "position", "text", "key", "terms", "score")
+
+    def __init__(self, rank, position, text, key):
+        self.rank = rank
+        self.position = position
+        self.text = text
+        self.key = key
+        self.terms = {_stem(t) for t in tokenize(text)}
+        self.score = 0.0
+
+
+def _unique_sentences(texts):
+    """Sentences of all chunks in retrieval order, without repeats or overlap fragments"""
+    kept = []
+    for rank, text in enumerate(texts):
+        for position, sentence in enumerate(split_sentences(text)):
+            key = _key(sentence)
+            if not key.strip():
+                continue
+            duplicate = False
+            for other in kept:
+                if key == other.key or (len(key) >= MIN_FRAGMENT_CHARS and key in other.key):
+                    duplicate = True
+                    break
+                if len(other.key) >= MIN_FRAGMENT_CHARS and other.key in key:
+                    # A fragment cut at a chunk boundary; keep the complete sentence in its place
+                    other.text, other.key = sentence, key
+                    other.terms = {_stem(t) for t in tokenize(sentence)}
+                    duplicate = True
+                    break
+            if not duplicate:
+                kept.append(_Sentence(rank, position, sentence, key))
+    return kept
+
+
+def compress_context(query, texts, token_budget):
+    """(context, stats) with the sentences of texts most relevant to query, within token_budget"""
+    raw_tokens = sum(estimate_tokens(t) for t in texts)
+    sentences = _unique_sentences(texts)
+
+    query_terms = {_stem(t) for t in tokenize(query)}
+    document_frequency = {}
+    for sentence in sentences:
+        for term in sentence.terms & query_terms:
+            document_frequency[term] = document_frequency.get(term, 0) + 1
+    previous = None
+    for sentence in sentences:
+        sentence.score = sum(
+            math.log(1 + len(sentences) / document_frequency[term]) for term in sentence.terms & query_terms
+        )
+        if not sentence.score and previous is not None and previous.rank == sentence.rank:
+            # Follow-on sentences ("It is treated with ...") share some of the preceding sentence's relevance
+            sentence.score = previous.score / 2
+        previous = sentence
+
+    relevant = [s for s in sentences if s.score > 0]
+    if relevant:
+        # The opening sentence of the best chunk usually names and defines the topic
+        candidates = relevant + [s for s in sentences if s.rank == 0 and s.position == 0 and not s.score]
+        candidates.sort(key=lambda s: (-s.score, s.rank, s.position))
+    else:
+        # No shared terms (e.g. a Telugu question over English text): trust the retrieval order
+        candidates = sentences
+
+    chosen = []
+    used = 0
+    for sentence in candidates:
+        cost = estimate_tokens(sentence.text)
+        if used + cost <= token_budget:
+            chosen.append(sentence)
+            used += cost
+    chosen.sort(key=lambda s: (s.rank, s.position))
+
+    blocks = []
+    for sentence in chosen:
+        if blocks and blocks[-1][0] == sentence.rank:
+            blocks[-1][1].append(sentence.text)
+        else:
+            blocks.append((sentence.rank, [sentence.text]))
+    context = "\n\n".join(" ".join(parts) for _, parts in blocks)
+    return context, {
+        "context_tokens_raw": raw_tokens,
+        "context_tokens": estimate_tokens(context),
+        "context_sentences": len(chosen),
+    }
@@ -0,0 +1,96 @@
+"""Embedding backends for the all-MiniLM-L6-v2 retrieval index.
+
+Select one with CHATBOT_EMBEDDER:
+  torch  sentence-transformers through langchain_huggingface (default)
+  onnx   the int8-quantized ONNX export (see export_onnx.py) on onnxruntime;
+         torch, transformers and sentence-transformers are never imported
+
+Both produce mean-pooled, L2-normalized 384-dimensional vectors, so an index
+built with one backend can be searched with queries from the other;
+`python -m benchmarks.embedder` measures how closely they agree.
+"""
+import json
+import os
+
+import numpy as np
+
+import index_store
+
+BACKENDS = ("torch", "onnx")
+ONNX_MODEL_FILE = "model.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+EXPORT_FILE = "export.json"
+
+
+def onnx_model_dir():
+    return os.environ.get("CHATBOT_ONNX_MODEL_DIR", os.path.join("models", f"{index_store.EMBEDDING_MODEL}-onnx-int8"))
+
+
+class OnnxEmbeddings:
+    """Same interface as HuggingFaceEmbeddings (embed_query / embed_documents)"""
+
+    name = "onnx"
+
+    def __init__(self, model_dir=None, threads=None, batch_size=32):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = model_dir or onnx_model_dir()
+        with open(os.path.join(model_dir, EXPORT_FILE), encoding="utf-8") as f:
+            self.export = json.load(f)
+        self.batch_size = batch_size
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.export["max_length"])
+        # Pad to the longest text of each batch, not to max_length
+        pad = self.export.get("pad_token", "[PAD]")
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id(pad), pad_token=pad)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, ONNX_MODEL_FILE), options, providers=["CPUExecutionProvider"],
+        )
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    def _encode(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": np.array([e.ids for e in encodings], dtype=np.int64), "attention_mask": mask}
+        if "token_type_ids" in self._inputs:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        hidden = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real tokens, then L2 normalization, as in the sentence-transformers pipeline
+        weights = mask[:, :, None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts):
+        # Batch texts of similar length together so little compute goes to padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            rows = order[start:start + self.batch_size]
+            for i, vector in zip(rows, self._encode([texts[i] for i in rows])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text):
+        return self._encode([text])[0].tolist()
+
+
+def load_embeddings(backend=None, batch_size=None):
+    """The embedder selected by backend or CHATBOT_EMBEDDER"""
+    backend = backend or os.environ.get("CHATBOT_EMBEDDER", "torch")
+    if backend == "onnx":
+        threads = int(os.environ.get("CHATBOT_ONNX_THREADS", "0")) or None
+        return OnnxEmbeddings(threads=threads, batch_size=batch_size or 32)
+    if backend == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        kwargs = {"encode_kwargs": {"batch_size": batch_size}} if batch_size else {}
+        return HuggingFaceEmbeddings(model_name=index_store.EMBEDDING_MODEL, **kwargs)
+    raise ValueError(f"Unknown embedder {backend!r}; expected one of {', '.join(BACKENDS)}")
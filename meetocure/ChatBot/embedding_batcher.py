@@ -0,0 +1,114 @@
+"""Dynamic micro-batching of query embeddings.
+
+Concurrent requests each need one query vector. Instead of one model call per
+request, queries that arrive while the batcher waits (up to max_wait_seconds
+after the first one) or while the previous batch is still running are
+embedded together in a single embed_documents call, up to max_batch texts.
+"""
+import asyncio
+import time
+
+from metrics import EMBED_BATCH_SIZE, EMBED_QUEUE_SECONDS
+
+
+class EmbeddingBatcher:
+    """Collect embed requests into batches run one at a time on the executor"""
+
+    def __init__(self, embed_documents, executor, max_batch=32, max_wait_seconds=0.003):
+        self.embed_documents = embed_documents
+        self.executor = executor
+        self.max_batch = max(1, max_batch)
+        self.max_wait_seconds = max_wait_seconds
+        self._pending = []  # (text, future, enqueued_at)
+        self._arrived = None
+        self._worker = None
+        self._loop = None
+
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+        self.sizes = {}
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or a new event loop (CLI sessions); state from the old loop is unusable
+            self._loop = loop
+            self._arrived = asyncio.Event()
+            self._pending = []
+            self._worker = None
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+
+    async def embed(self, text, stats=None):
+        """The query vector for text; stats["embed_batch"] gets the size of the batch it ran in"""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._pending.append((text, future, time.perf_counter()))
+        self._arrived.set()
+        vector, size = await future
+        if stats is not None:
+            stats["embed_batch"] = size
+        return vector
+
+    async def _fill(self):
+        """Give a partial batch up to max_wait_seconds to fill up"""
+        deadline = self._loop.time() + self.max_wait_seconds
+        while len(self._pending) < self.max_batch:
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                return
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                self._arrived.clear()
+                await self._arrived.wait()
+            await self._fill()
+            # Callers that gave up while queued are dropped before the model sees them
+            live = [entry for entry in self._pending if not entry[1].done()]
+            batch, self._pending = live[:self.max_batch], live[self.max_batch:]
+            if batch:
+                await self._embed_batch(batch)
+
+    async def _embed_batch(self, batch):
+        started = time.perf_counter()
+        for _, _, enqueued_at in batch:
+            EMBED_QUEUE_SECONDS.observe(started - enqueued_at)
+        size = len(batch)
+        try:
+            vectors = await self._loop.run_in_executor(self.executor, self.embed_documents, [t for t, _, _ in batch])
+        except Exception as exc:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        finally:
+            self._record(size)
+        for (_, future, _), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result((vector, size))
+
+    def _record(self, size):
+        self.batches += 1
+        self.items += size
+        self.max_batch_seen = max(self.max_batch_seen, size)
+        self.sizes[size] = self.sizes.get(size, 0) + 1
+        EMBED_BATCH_SIZE.observe(size)
+
+    def stats(self):
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait_seconds * 1000,
+            "queued": len(self._pending),
+            "batches": self.batches,
+            "embedded": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_seen": self.max_batch_seen,
+            "batch_sizes": dict(sorted(self.sizes.items())),
+        }
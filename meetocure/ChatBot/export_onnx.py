@@ -0,0 +1,88 @@
+"""Export all-MiniLM-L6-v2 to an int8-quantized ONNX model for CHATBOT_EMBEDDER=onnx.
+
+Run once offline; needs torch and transformers (only here) plus onnxruntime.
+The output directory holds model.onnx, tokenizer.json and export.json, and is
+what CHATBOT_ONNX_MODEL_DIR points at.
+
+Usage:
+    python export_onnx.py
+    python export_onnx.py --out models/minilm-fp32 --no-quantize
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+import index_store
+from embedders import EXPORT_FILE, ONNX_MODEL_FILE, TOKENIZER_FILE, onnx_model_dir
+
+logger = logging.getLogger(__name__)
+
+HF_MODEL = f"sentence-transformers/{index_store.EMBEDDING_MODEL}"
+# sentence-transformers truncates this model's inputs at 256 tokens
+MAX_LENGTH = 256
+INPUTS = ("input_ids", "attention_mask", "token_type_ids")
+
+
+def export(out_dir, quantize=True, opset=17):
+    """Write the model, its tokenizer and export settings to out_dir"""
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    started = time.perf_counter()
+    tokenizer = AutoTokenizer.from_pretrained(HF_MODEL)
+    model = AutoModel.from_pretrained(HF_MODEL).eval()
+    sample = tokenizer(["what are the symptoms of malaria"], return_tensors="pt")
+
+    os.makedirs(out_dir, exist_ok=True)
+    fp32_path = os.path.join(out_dir, "model-fp32.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in INPUTS),
+            fp32_path,
+            input_names=list(INPUTS),
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in INPUTS + ("last_hidden_state",)},
+            opset_version=opset,
+        )
+
+    model_path = os.path.join(out_dir, ONNX_MODEL_FILE)
+    if quantize:
+        # Weights to int8, activations quantized on the fly: no calibration data needed
+        quantize_dynamic(fp32_path, model_path, weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+    else:
+        os.replace(fp32_path, model_path)
+
+    tokenizer.backend_tokenizer.save(os.path.join(out_dir, TOKENIZER_FILE))
+    with open(os.path.join(out_dir, EXPORT_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "model": HF_MODEL,
+            "max_length": MAX_LENGTH,
+            "pad_token": tokenizer.pad_token,
+            "pooling": "mean",
+            "normalize": True,
+            "quantized": quantize,
+            "opset": opset,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }, f, indent=2)
+    logger.info("Exported %s to %s (%.1f MB) in %.1fs", HF_MODEL, out_dir,
+                os.path.getsize(model_path) / 2**20, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX for CPU inference")
+    parser.add_argument("--out", default=None, help="Output directory (default: CHATBOT_ONNX_MODEL_DIR)")
+    parser.add_argument("--no-quantize", action="store_true", help="Keep float32 weights")
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    export(args.out or onnx_model_dir(), quantize=not args.no_quantize, opset=args.opset)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Gunicorn settings for the chatbot API: `gunicorn -c gunicorn.conf.py main:app`.
+
+With CHATBOT_PRELOAD=1 (the default) the master loads the embedding model and,
+for the numpy and hybrid retrievers, opens the index once, then forks the
+workers, which share those pages copy-on-write instead of each loading its own
+copy. A Chroma index holds SQLite connections that must not be shared across a
+fork, so with CHATBOT_RETRIEVER=chroma every worker opens it itself. Each worker still builds
+its own executor, HTTP clients, caches and sessions at startup (main.lifespan),
+since threads and sockets do not survive a fork.
+
+Compare per-worker cost with chatbot_process_memory_bytes{kind="pss"} on /metrics.
+"""
+import gc
+import os
+
+bind = os.environ.get("CHATBOT_BIND", "127.0.0.1:5001")
+workers = int(os.environ.get("CHATBOT_WORKERS", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Model calls are budgeted in the app (CHATBOT_LLM_BUDGET); leave room for warm-up
+timeout = int(os.environ.get("CHATBOT_WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+preload_app = os.environ.get("CHATBOT_PRELOAD", "1") == "1"
+
+if preload_app:
+    # No collections in the master while the shared objects are allocated, so
+    # they are packed densely instead of interleaved with freed holes
+    gc.disable()
+
+
+def on_starting(server):
+    """Runs in the master after main:app was imported and before any worker is forked"""
+    if not preload_app:
+        return
+    import chatbot_response
+
+    timings = chatbot_response.preload_shared_components()
+    for phase, ms in timings.items():
+        server.log.info("Preloaded %-10s %9.1f ms", phase, ms)
+    # Move everything allocated so far out of the collector's reach: a collection in a
+    # worker would otherwise write to every object header and un-share its page
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        gc.enable()
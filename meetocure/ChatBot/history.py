@@ -0,0 +1,115 @@
+import asyncio
+import logging
+
+from langchain_core.messages import HumanMessage
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text):
+    """Cheap token estimate: ~4 ASCII chars per token, one token per non-ASCII char"""
+    if not text:
+        return 0
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return (len(text) - non_ascii + 3) // 4 + non_ascii
+
+
+def format_turn(turn):
+    return f"Human: {turn.question}\nAI: {turn.answer}"
+
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and a medical assistant.
+Keep it under {max_words} words. Keep symptoms, conditions, medications, ages and other facts the user shared.
+
+Current summary:
+{summary}
+
+New conversation lines:
+{lines}
+
+Updated summary:"""
+
+
+class HistoryManager:
+    """Token-budgeted history window with an incrementally updated rolling summary"""
+
+    def __init__(self, sessions, llm, max_turns=6, token_budget=600, summary_words=120):
+        self.sessions = sessions
+        self.llm = llm
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summary_words = summary_words
+        self._tasks = set()
+
+    def render(self, session, stats=None):
+        """Build the history block for a prompt and record its token counts"""
+        session = self.sessions.snapshot(session)
+        summary_tokens = estimate_tokens(session.summary)
+        budget = self.token_budget - summary_tokens
+
+        lines = []
+        used = 0
+        for turn in reversed(session.turns):
+            if len(lines) >= self.max_turns:
+                break
+            line = format_turn(turn)
+            cost = estimate_tokens(line)
+            if lines and used + cost > budget:
+                break
+            lines.append(line)
+            used += cost
+        lines.reverse()
+
+        parts = []
+        if session.summary:
+            parts.append(f"Summary of earlier conversation: {session.summary}")
+        parts.extend(lines)
+
+        if stats is not None:
+            stats["history_turns"] = len(lines)
+            stats["history_tokens"] = used + summary_tokens
+            stats["summary_tokens"] = summary_tokens
+            stats["pending_summary_turns"] = len(session.pending)
+        return "\n".join(parts)
+
+    def compact(self, session):
+        """Move turns that no longer fit the window out for summarization"""
+        view = self.sessions.snapshot(session)
+        turns = list(view.turns)
+        while len(turns) > 1 and (
+            len(turns) > self.max_turns
+            or sum(estimate_tokens(format_turn(t)) for t in turns) > self.token_budget
+        ):
+            self.sessions.fold_oldest(session)
+            turns.pop(0)
+
+        if (view.pending or len(turns) < len(view.turns)) and not session.summarizing:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return
+            session.summarizing = True
+            task = loop.create_task(self._summarize(session))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _summarize(self, session):
+        """Fold pending turns into the summary with the fast model, off the request path"""
+        try:
+            while True:
+                view = self.sessions.snapshot(session)
+                if not view.pending:
+                    break
+                folded = view.pending
+                prompt = SUMMARY_PROMPT.format(
+                    max_words=self.summary_words,
+                    summary=view.summary or "(none)",
+                    lines="\n".join(format_turn(t) for t in folded),
+                )
+                result = await self.llm.ainvoke([HumanMessage(content=prompt)])
+                # By position, not count: pending may have moved on while the model ran
+                self.sessions.apply_summary(session, result.content.strip(), view.start + len(folded))
+        except Exception:
+            logger.exception("History summarization failed for session %s", session.key)
+        finally:
+            session.summarizing = False
@@ -0,0 +1,315 @@
+"""Durable conversation history shared by every worker, in SQLite (WAL mode).
+
+SessionStore keeps a bounded window of recent sessions in memory; this is
+what sits behind it. Each turn is appended as a row and each session has one
+row with its rolling summary and a version that every write bumps:
+
+  reads   a session missing from memory is loaded with one indexed query
+          for its summary and the tail of its turns, never the whole
+          history; a cached session is reloaded only when its version on
+          disk moved on, i.e. another worker answered it
+  writes  are queued and committed by a writer thread in batches, one
+          fsync'd transaction per flush interval, so requests never wait
+          on the disk
+  summary each one records the absolute position of the last turn it
+          covers, and an older one never replaces a newer one, so two
+          workers summarizing the same turns cannot skip any
+  compact turns already folded into a summary are deleted, sessions idle
+          past the retention period are dropped, then the WAL is
+          checkpointed and freed pages are returned to the filesystem
+
+WAL readers never block on the writer, and writers from different workers
+are serialized by SQLite's own lock.
+"""
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    key TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    summary TEXT NOT NULL DEFAULT '',
+    summarized INTEGER NOT NULL DEFAULT 0,  -- oldest turns already folded into summary
+    turn_count INTEGER NOT NULL DEFAULT 0,  -- turns ever appended; with summarized, counts from the first turn
+    dropped INTEGER NOT NULL DEFAULT 0,     -- oldest turns deleted by compaction
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY,
+    session TEXT NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turns_session ON turns (session, id);
+"""
+
+
+class SessionRecord:
+    """A session as loaded from disk: its version, summary, and newest unsummarized turns (oldest first).
+
+    start is the position of the first of those turns in the whole
+    conversation; older unsummarized turns left out are covered by the next
+    summary, since set_summary takes the position it summarized through.
+    """
+    __slots__ = ("version", "summary", "turns", "start")
+
+    def __init__(self, version, summary, turns, start=0):
+        self.version = version
+        self.summary = summary
+        self.turns = turns
+        self.start = start
+
+
+class HistoryStore:
+    def __init__(self, path, flush_seconds=0.05, compact_seconds=3600, retention_seconds=30 * 86400,
+                 keep_turns=200):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.compact_seconds = compact_seconds
+        self.retention_seconds = retention_seconds
+        self.keep_turns = keep_turns
+
+        self._reader = self._connect()
+        self._reader_lock = threading.Lock()
+        self._queue = []
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.loads = 0
+        self.writes = 0
+        self.batches = 0
+        self.commit_ms = 0.0
+        self.max_batch = 0
+        self.compactions = 0
+        self.compacted_turns = 0
+        self.write_errors = 0
+
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # FULL fsyncs the WAL at every commit: a flushed turn survives power loss
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.executescript(SCHEMA)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]
+        if "dropped" not in columns:
+            # Stores written before compaction kept its own count
+            try:
+                conn.execute("ALTER TABLE sessions ADD COLUMN dropped INTEGER NOT NULL DEFAULT 0")
+            except sqlite3.OperationalError:
+                pass  # another connection added it first
+        return conn
+
+    # Reads, on the caller's thread
+
+    def version(self, key):
+        """The session's version on disk (0 if it has never been written)"""
+        with self._reader_lock:
+            row = self._reader.execute("SELECT version FROM sessions WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def load(self, key, max_turns):
+        """SessionRecord with the summary and at most max_turns unsummarized turns"""
+        with self._reader_lock:
+            # One read transaction, so the summary and turns are from the same commit
+            self._reader.execute("BEGIN")
+            try:
+                row = self._reader.execute(
+                    "SELECT version, summary, summarized, turn_count, dropped FROM sessions WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return SessionRecord(0, "", [])
+                version, summary, summarized, turn_count, dropped = row
+                start = max(summarized, turn_count - max_turns, dropped)
+                turns = self._reader.execute(
+                    "SELECT question, answer, created_at FROM turns WHERE session = ? ORDER BY id LIMIT -1 OFFSET ?",
+                    (key, start - dropped),
+                ).fetchall()
+            finally:
+                self._reader.execute("COMMIT")
+        self.loads += 1
+        return SessionRecord(version, summary, turns, start)
+
+    # Writes, queued for the writer thread
+
+    def _enqueue(self, op):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("History store is closed")
+            self._queue.append(op)
+            self._cond.notify()
+
+    def append(self, key, question, answer, created_at, on_commit=None):
+        """Queue a turn; on_commit() runs on the writer thread once it is on disk (or failed to get there)"""
+        self._enqueue(("turn", key, (question, answer, created_at), on_commit))
+
+    def set_summary(self, key, summary, through, on_commit=None):
+        """Queue a new rolling summary of the first `through` turns; ignored if a summary of more already landed"""
+        self._enqueue(("summary", key, (summary, through), on_commit))
+
+    def clear(self, key=None, on_commit=None):
+        """Queue forgetting one session's history, or every session's"""
+        self._enqueue(("clear", key, None, on_commit))
+
+    def _bump(self, conn, key, now):
+        conn.execute(
+            "INSERT INTO sessions (key, version, updated_at) VALUES (?, 1, ?) "
+            "ON CONFLICT (key) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at",
+            (key, now),
+        )
+
+    def _apply(self, conn, batch):
+        """Write one batch in a single transaction"""
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for kind, key, value, _ in batch:
+                if kind == "flush":
+                    continue
+                if kind == "turn":
+                    question, answer, created_at = value
+                    conn.execute(
+                        "INSERT INTO turns (session, question, answer, created_at) VALUES (?, ?, ?, ?)",
+                        (key, question, answer, created_at),
+                    )
+                    self._bump(conn, key, now)
+                    conn.execute("UPDATE sessions SET turn_count = turn_count + 1 WHERE key = ?", (key,))
+                elif kind == "summary":
+                    summary, through = value
+                    # Bumped either way, so a worker whose summary lost reloads the newer one
+                    self._bump(conn, key, now)
+                    conn.execute(
+                        "UPDATE sessions SET summary = ?, summarized = MIN(?, turn_count) "
+                        "WHERE key = ? AND summarized < MIN(?, turn_count)",
+                        (summary, through, key, through),
+                    )
+                elif key is None:
+                    conn.execute("DELETE FROM turns")
+                    # Keep the rows with a new version so other workers drop their cached copies
+                    conn.execute(
+                        "UPDATE sessions SET version = version + 1, summary = '', summarized = 0, turn_count = 0, "
+                        "dropped = 0, updated_at = ?", (now,),
+                    )
+                else:
+                    conn.execute("DELETE FROM turns WHERE session = ?", (key,))
+                    self._bump(conn, key, now)
+                    conn.execute(
+                        "UPDATE sessions SET summary = '', summarized = 0, turn_count = 0, dropped = 0 WHERE key = ?",
+                        (key,),
+                    )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _compact(self, conn):
+        """Drop summarized turns, excess old turns and expired sessions, then shrink the files"""
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            deleted = 0
+            rows = conn.execute(
+                "SELECT key, summarized, turn_count, dropped FROM sessions "
+                "WHERE summarized > dropped OR turn_count - dropped > ?",
+                (self.keep_turns,),
+            ).fetchall()
+            for key, summarized, turn_count, dropped in rows:
+                drop = max(summarized, turn_count - self.keep_turns) - dropped
+                deleted += conn.execute(
+                    "DELETE FROM turns WHERE id IN (SELECT id FROM turns WHERE session = ? ORDER BY id LIMIT ?)",
+                    (key, drop),
+                ).rowcount
+                # Positions stay as they were, and so does the version: cached copies stay valid
+                conn.execute("UPDATE sessions SET dropped = dropped + ? WHERE key = ?", (drop, key))
+            expired = [k for (k,) in conn.execute(
+                "SELECT key FROM sessions WHERE updated_at < ?", (now - self.retention_seconds,)
+            )]
+            for key in expired:
+                deleted += conn.execute("DELETE FROM turns WHERE session = ?", (key,)).rowcount
+                conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("PRAGMA incremental_vacuum")
+        self.compactions += 1
+        self.compacted_turns += deleted
+        logger.info("Compacted history: %d turns and %d idle sessions removed", deleted, len(expired))
+
+    def _write_loop(self):
+        conn = self._connect()
+        next_compaction = time.monotonic() + self.compact_seconds
+        while True:
+            with self._cond:
+                if not self._queue and not self._closed:
+                    self._cond.wait(timeout=min(self.compact_seconds or 60, 60))
+                pending = bool(self._queue) and not self._closed
+            if pending:
+                # Let the rest of this flush interval's writes join the batch
+                time.sleep(self.flush_seconds)
+            with self._cond:
+                batch, self._queue = self._queue, []
+                closing = self._closed
+            if batch:
+                started = time.perf_counter()
+                try:
+                    self._apply(conn, batch)
+                except Exception:
+                    self.write_errors += 1
+                    logger.exception("Could not write %d history records; they are lost", len(batch))
+                self.commit_ms += (time.perf_counter() - started) * 1000
+                self.batches += 1
+                self.writes += len(batch)
+                self.max_batch = max(self.max_batch, len(batch))
+                for _, _, _, on_commit in batch:
+                    if on_commit is not None:
+                        on_commit()
+            if closing:
+                conn.close()
+                return
+            if self.compact_seconds and time.monotonic() >= next_compaction:
+                next_compaction = time.monotonic() + self.compact_seconds
+                try:
+                    self._compact(conn)
+                except Exception:
+                    logger.exception("History compaction failed")
+
+    def flush(self, timeout=10):
+        """Wait until everything queued so far is on disk"""
+        done = threading.Event()
+        self._enqueue(("flush", None, None, done.set))
+        return done.wait(timeout)
+
+    def close(self):
+        """Write what is queued and stop the writer"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._writer.join(timeout=10)
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "queued": len(self._queue),
+            "loads": self.loads,
+            "writes": self.writes,
+            "batches": self.batches,
+            "max_batch": self.max_batch,
+            "commit_ms_mean": self.commit_ms / self.batches if self.batches else 0.0,
+            "write_errors": self.write_errors,
+            "compactions": self.compactions,
+            "compacted_turns": self.compacted_turns,
+        }
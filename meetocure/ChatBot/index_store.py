@@ -0,0 +1,77 @@
+import json
+import os
+import re
+
+# Prebuilt, versioned retrieval indexes live under <index root>/<version>/,
+# and <index root>/CURRENT names the version the server should open.
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+CHROMA_DIR = "chroma"
+NUMPY_DIR = "numpy"
+BM25_DIR = "bm25"
+TITLES_DIR = "titles"
+COLLECTION_NAME = "langchain"
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+VERSION_RE = re.compile(r"^v\d+$")
+
+
+def index_root():
+    return os.environ.get("CHATBOT_INDEX_DIR", "indexes")
+
+
+def version_path(version, root=None):
+    root = root or index_root()
+    return os.path.join(root, version)
+
+
+def list_versions(root=None):
+    """All complete snapshot versions, oldest first"""
+    root = root or index_root()
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        name for name in os.listdir(root)
+        if VERSION_RE.match(name) and os.path.isfile(os.path.join(root, name, MANIFEST_FILE))
+    )
+
+
+def next_version(root=None):
+    root = root or index_root()
+    versions = list_versions(root)
+    number = int(versions[-1].lstrip("v")) + 1 if versions else 1
+    return f"v{number:04d}"
+
+
+def current_version(root=None):
+    """The version named in CURRENT, or None when no index was built yet"""
+    root = root or index_root()
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return version or None
+
+
+def set_current(version, root=None):
+    """Atomically point CURRENT at version"""
+    root = root or index_root()
+    tmp_path = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+
+def load_manifest(version, root=None):
+    root = root or index_root()
+    with open(os.path.join(version_path(version, root), MANIFEST_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(version, manifest, root=None):
+    root = root or index_root()
+    path = os.path.join(version_path(version, root), MANIFEST_FILE)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,267 @@
+"""Latency-budgeted model calls: timeouts, bounded retries, hedging and a circuit breaker.
+
+Every medical answer has a budget. The large model gets until the hedge point
+to answer; after that the fast model is started on the same messages and
+whichever answers first wins. While the large model keeps failing or running
+slow, the breaker opens and requests go straight to the fast model until a
+probe succeeds again.
+"""
+import asyncio
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+# Paths an answer can be served by, reported as stats["served_by"]
+SERVED_BY = ("medical", "fast", "fast_hedge", "fast_fallback", "fast_circuit_open")
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open single probe after a cool-down"""
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+
+    def allow(self):
+        """Whether the protected model may be called now"""
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+            # This caller becomes the probe; everyone else keeps using the fallback
+            self.state = "half_open"
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.state = "closed"
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.trips += 1
+
+    def release(self):
+        """The probe was abandoned without a verdict; wait out another cool-down"""
+        if self.state == "half_open":
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def stats(self):
+        return {"state": self.state, "consecutive_failures": self.failures, "trips": self.trips}
+
+
+class BudgetedLLM:
+    """Run the medical model under a latency budget, backed by the fast model"""
+
+    def __init__(self, primary, fallback, budget_seconds=20.0, hedge_seconds=12.0,
+                 retries=1, backoff_seconds=0.25, breaker=None):
+        self.primary = primary
+        self.fallback = fallback
+        self.budget_seconds = budget_seconds
+        self.hedge_seconds = min(hedge_seconds, budget_seconds)
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.breaker = breaker or CircuitBreaker()
+        self.served = dict.fromkeys(SERVED_BY, 0)
+        self.primary_errors = 0
+        self.timeouts = 0
+
+    def _serve(self, stats, path, attempts=0, message=None):
+        """Count the path that answered and return the answer text"""
+        self.served[path] += 1
+        if stats is not None:
+            stats["served_by"] = path
+            stats["llm_attempts"] = attempts
+            usage = getattr(message, "usage_metadata", None)
+            if usage:
+                stats["prompt_tokens"] = usage.get("input_tokens")
+                stats["completion_tokens"] = usage.get("output_tokens")
+        return message.content if message is not None else None
+
+    async def _call_primary(self, messages, deadline, attempts):
+        """Primary model with bounded retries, each attempt capped by the remaining budget"""
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            attempts[0] = attempt + 1
+            try:
+                result = await asyncio.wait_for(self.primary.ainvoke(messages), deadline - loop.time())
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as exc:
+                self.primary_errors += 1
+                self.breaker.record_failure()
+                backoff = self.backoff_seconds * (2 ** attempt) * (0.5 + random.random())
+                if attempt == self.retries or not self.breaker.allow() or loop.time() + backoff >= deadline:
+                    raise
+                logger.warning("Medical model attempt %d failed (%r); retrying", attempt + 1, exc)
+                await asyncio.sleep(backoff)
+            else:
+                self.breaker.record_success()
+                return result
+
+    async def _call_fallback(self, messages, deadline):
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(self.fallback.ainvoke(messages), deadline - loop.time())
+
+    async def ainvoke(self, messages, stats=None):
+        """Answer messages within the budget; raises only if no model could answer in time"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.budget_seconds
+
+        if not self.breaker.allow():
+            result = await self._call_fallback(messages, deadline)
+            return self._serve(stats, "fast_circuit_open", 0, result)
+
+        attempts = [0]
+        hedge = None
+        primary = asyncio.ensure_future(self._call_primary(messages, deadline, attempts))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.hedge_seconds)
+            if primary in done:
+                if primary.exception() is None:
+                    return self._serve(stats, "medical", attempts[0], primary.result())
+                logger.warning("Medical model failed (%r); falling back to the fast model", primary.exception())
+                result = await self._call_fallback(messages, deadline)
+                return self._serve(stats, "fast_fallback", attempts[0], result)
+
+            # Too slow: hedge with the fast model and keep whichever answers first
+            hedge = asyncio.ensure_future(self._call_fallback(messages, deadline))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=deadline - loop.time(),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.timeouts += 1
+                    raise asyncio.TimeoutError("no model answered within the latency budget")
+                for task in done:
+                    if task.exception() is None:
+                        if task is primary:
+                            return self._serve(stats, "medical", attempts[0], task.result())
+                        # Losing to the hedge counts against the large model's health
+                        self.breaker.record_failure()
+                        return self._serve(stats, "fast_hedge", attempts[0], task.result())
+            raise hedge.exception()
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def ainvoke_fast(self, messages, stats=None):
+        """Casual messages: fast model only, under the same budget"""
+        loop = asyncio.get_running_loop()
+        result = await self._call_fallback(messages, loop.time() + self.budget_seconds)
+        return self._serve(stats, "fast", 0, result)
+
+    async def _chunks(self, stream, deadline):
+        """Text of stream's remaining chunks, each read within what is left of the budget"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), deadline - loop.time())
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise
+            if chunk.content:
+                yield chunk.content
+
+    async def _astream_fallback(self, messages, deadline, first_timeout, stats, path, attempts):
+        """Stream from the fast model: first chunk within first_timeout, all of it by the deadline"""
+        loop = asyncio.get_running_loop()
+        stream = self.fallback.astream(messages)
+        try:
+            try:
+                first = await asyncio.wait_for(stream.__anext__(), min(first_timeout, deadline - loop.time()))
+            except StopAsyncIteration:
+                self._serve(stats, path, attempts)
+                return
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise
+            self._serve(stats, path, attempts)
+            if first.content:
+                yield first.content
+            async for content in self._chunks(stream, deadline):
+                yield content
+        finally:
+            await stream.aclose()
+
+    async def astream_fast(self, messages, stats=None):
+        """Stream a casual reply from the fast model: first chunk by the hedge point, all of it within the budget"""
+        loop = asyncio.get_running_loop()
+        async for content in self._astream_fallback(
+                messages, loop.time() + self.budget_seconds, self.hedge_seconds, stats, "fast", 0):
+            yield content
+
+    async def astream(self, messages, stats=None):
+        """Yield answer text within the budget; falls back to the fast model if the first token misses the hedge point"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.budget_seconds
+        if self.breaker.allow():
+            stream = self.primary.astream(messages)
+            try:
+                first = await asyncio.wait_for(stream.__anext__(), self.hedge_seconds)
+            except StopAsyncIteration:
+                self.breaker.record_success()
+                self._serve(stats, "medical", 1)
+                return
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as exc:
+                self.breaker.record_failure()
+                await stream.aclose()
+                timed_out = isinstance(exc, asyncio.TimeoutError)
+                if not timed_out:
+                    self.primary_errors += 1
+                logger.warning("Medical model stream failed to start (%r); using the fast model", exc)
+                path = "fast_hedge" if timed_out else "fast_fallback"
+            else:
+                self._serve(stats, "medical", 1)
+                try:
+                    if first.content:
+                        yield first.content
+                    async for content in self._chunks(stream, deadline):
+                        yield content
+                except Exception as exc:
+                    # Failing midway counts against the model like failing to start
+                    self.breaker.record_failure()
+                    if not isinstance(exc, asyncio.TimeoutError):
+                        self.primary_errors += 1
+                    raise
+                except BaseException:
+                    # Cancelled, or the client went away: no verdict on the model
+                    self.breaker.release()
+                    raise
+                else:
+                    self.breaker.record_success()
+                finally:
+                    await stream.aclose()
+                return
+        else:
+            path = "fast_circuit_open"
+
+        async for content in self._astream_fallback(
+                messages, deadline, self.budget_seconds, stats, path, 1 if path != "fast_circuit_open" else 0):
+            yield content
+
+    def stats(self):
+        return {
+            "budget_seconds": self.budget_seconds,
+            "hedge_seconds": self.hedge_seconds,
+            "served_by": dict(self.served),
+            "primary_errors": self.primary_errors,
+            "timeouts": self.timeouts,
+            "breaker": self.breaker.stats(),
+        }
@@ -1,44 +1,370 @@
-from fastapi import FastAPI, Form
-from pydantic import BaseModel
-from chatbot_response import get_chatbot_response   # import your logic
-# from front_integration import process_question 
-# from fastapi.responses import JSONResponse
-app = FastAPI(title="Medical Chatbot API")
-
-# Define request body
-class Message(BaseModel):
-    text: str
-@app.get("/")
-async def root():
-    return {"Chatbot": "Hello! I'm your medical assistant. Ask me anything."}
-
-# Define API endpoint
-@app.post("/assistance")
-async def chat(msg: Message):
-    reply = get_chatbot_response(msg.text)
-    return {"reply": reply}
-
-
-
-# class Question(BaseModel):
-#     question: str
-
-# def detect_language(text: str) -> str:
-#     for ch in text:
-#         if "\u0C00" <= ch <= "\u0C7F":   # Telugu Unicode range
-#             return "te"
-#     return "en"
-
-# @app.post("/chat/voice")
-# def ask_question(payload: Question):
-#     try:
-#         # Auto-detect lang from question
-#         lang = detect_language(payload.question)
-#         answer = process_question(payload.question, lang)
-#         return JSONResponse(content={
-#             "question": payload.question,
-#             "lang_detected": lang,
-#             "answer": answer
-#         })
-#     except Exception as e:
-#         return JSONResponse(content={"error": str(e)}, status_code=500)
+import time
+_import_started = time.perf_counter()
+import asyncio
+import hmac
+import json
+import logging
+import os
+from contextlib import aclosing, asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, File, Form, Header, HTTPException, Request, UploadFile
+from dotenv import load_dotenv
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from admission import PRIORITIES, AdmissionController, Overloaded
+from snapshot_manager import SnapshotError
+from voice import VoiceError, VoicePipeline
+import metrics
+from metrics import REGISTRY, Gauge, server_timing, span
+from chatbot_response import (   # import your logic
+    aget_chatbot_response,
+    abatch_chatbot_responses,
+    astream_chatbot_response,
+    clear_chat_history,
+    get_session_stats,
+    get_cache_stats,
+    get_llm_stats,
+    get_embedding_stats,
+    awarm_up_medical_assistant,
+    aactivate_index,
+    arollback_index,
+    awatch_index,
+    get_index_status,
+    preload_stats,
+    shared_components,
+)
+load_dotenv()
+logging.basicConfig(level=os.environ.get("CHATBOT_LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s %(message)s")
+logging.getLogger("httpx").setLevel(logging.WARNING)  # one INFO line per model call otherwise
+logger = logging.getLogger(__name__)
+
+# Build and warm the assistant at startup (CHATBOT_WARMUP=0 builds it on the first request instead)
+WARM_UP = os.environ.get("CHATBOT_WARMUP", "1") == "1"
+startup = {"ready": not WARM_UP, "error": None, "phases_ms": {"imports": (time.perf_counter() - _import_started) * 1000}}
+
+async def _warm_up():
+    started = time.perf_counter()
+    try:
+        phases = await awarm_up_medical_assistant()
+    except Exception as exc:
+        startup["error"] = f"{type(exc).__name__}: {exc}"
+        logger.exception("Chatbot warm-up failed; /ready stays unready")
+        return
+    startup["phases_ms"].update(phases)
+    if VOICE_ENABLED:
+        # Voice is optional: a missing engine leaves /chat/voice failing, not the whole service unready
+        voice_started = time.perf_counter()
+        try:
+            await _voice().awarm_up()
+            startup["phases_ms"]["voice"] = (time.perf_counter() - voice_started) * 1000
+        except Exception:
+            logger.exception("Voice pipeline warm-up failed")
+    startup["phases_ms"]["warm_up_total"] = (time.perf_counter() - started) * 1000
+    for phase, ms in startup["phases_ms"].items():
+        logger.info("Startup phase %-16s %9.1f ms", phase, ms)
+    startup["ready"] = True
+
+# /chat/voice: speech in, answer text and speech out (see voice.py for the engines)
+VOICE_ENABLED = os.environ.get("CHATBOT_VOICE", "1") == "1"
+MAX_VOICE_BYTES = int(os.environ.get("CHATBOT_VOICE_MAX_BYTES", str(10 * 2**20)))
+voice_pipeline = None
+
+def _voice():
+    # Built on first use in each worker: its thread and process pools must not cross a fork
+    global voice_pipeline
+    if voice_pipeline is None:
+        voice_pipeline = VoicePipeline()
+    return voice_pipeline
+
+# Seconds between checks of the index CURRENT file for a new snapshot (0 turns the watcher off)
+INDEX_WATCH_INTERVAL = float(os.environ.get("CHATBOT_INDEX_WATCH_SECONDS", "10"))
+# Token for the /admin endpoints, sent as X-Admin-Token; without one they are disabled
+ADMIN_TOKEN = os.environ.get("CHATBOT_ADMIN_TOKEN")
+
+@asynccontextmanager
+async def lifespan(app):
+    # Warm up in the background: the process answers / (liveness) at once, /ready once warm
+    tasks = []
+    if WARM_UP:
+        tasks.append(asyncio.create_task(_warm_up()))
+    if INDEX_WATCH_INTERVAL > 0:
+        tasks.append(asyncio.create_task(awatch_index(INDEX_WATCH_INTERVAL)))
+    yield
+    for task in tasks:
+        if not task.done():
+            task.cancel()
+
+app = FastAPI(title="Medical Chatbot API", lifespan=lifespan)
+
+# Bounded queue in front of the model: doctors first, excess load is shed with Retry-After
+admission = AdmissionController(
+    max_active=int(os.environ.get("CHATBOT_MAX_ACTIVE", "8")),
+    max_queue=int(os.environ.get("CHATBOT_MAX_QUEUE", "64")),
+    max_wait_seconds=float(os.environ.get("CHATBOT_MAX_QUEUE_WAIT", "10")),
+)
+
+# Stage timings as a Server-Timing header: always when set, or per request with `X-Debug-Timing: 1`
+TIMING_HEADER = os.environ.get("CHATBOT_TIMING_HEADER", "0") == "1"
+
+def _wants_timing(request):
+    return TIMING_HEADER or request.headers.get("x-debug-timing") == "1"
+
+@app.middleware("http")
+async def observe_http(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.HTTP_SECONDS.observe(
+        time.perf_counter() - started,
+        method=request.method,
+        path=route.path if route else "unmatched",
+        status=response.status_code,
+    )
+    return response
+
+@app.exception_handler(Overloaded)
+async def overloaded(request: Request, exc: Overloaded):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": "Chatbot is busy, please retry later", "reason": exc.reason, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(SnapshotError)
+async def snapshot_error(request: Request, exc: SnapshotError):
+    return JSONResponse(status_code=409, content={"detail": str(exc), "index": get_index_status()})
+
+@app.exception_handler(VoiceError)
+async def voice_error(request: Request, exc: VoiceError):
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+
+# Define request body
+class Message(BaseModel):
+    text: str
+    session_id: Optional[str] = None
+    patientId: Optional[str] = None
+    doctorId: Optional[str] = None
+    priority: Optional[str] = None
+
+    def priority_class(self):
+        if self.priority in PRIORITIES:
+            return self.priority
+        return "doctor" if self.doctorId else "patient"
+
+    def session_key(self):
+        if self.session_id:
+            return self.session_id
+        if self.doctorId:
+            return f"doctor:{self.doctorId}"
+        if self.patientId:
+            return f"patient:{self.patientId}"
+        return None
+
+@app.get("/")
+async def root():
+    return {"Chatbot": "Hello! I'm your medical assistant. Ask me anything."}
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 until the assistant is built and warmed up"""
+    return JSONResponse(
+        status_code=200 if startup["ready"] else 503,
+        content={
+            "ready": startup["ready"],
+            "error": startup["error"],
+            "phases_ms": startup["phases_ms"],
+            # Set when gunicorn loaded the model and index before forking (see gunicorn.conf.py)
+            "preloaded_ms": preload_stats.get("timings_ms") if shared_components else None,
+        },
+    )
+
+# Define API endpoint
+@app.post("/assistance")
+async def chat(msg: Message, request: Request, response: Response):
+    stats = {}
+    with span(stats, "admission"):
+        ticket = await admission.acquire(msg.priority_class())
+    async with ticket:
+        reply = await aget_chatbot_response(msg.text, msg.session_key(), stats)
+    if _wants_timing(request):
+        response.headers["Server-Timing"] = server_timing(stats)
+    return {"reply": reply, "stats": stats}
+
+@app.post("/chat/voice")
+async def chat_voice(
+    request: Request,
+    response: Response,
+    audio: UploadFile = File(...),
+    patientId: Optional[str] = Form(None),
+    doctorId: Optional[str] = Form(None),
+    session_id: Optional[str] = Form(None),
+    speak: bool = Form(True),
+):
+    """Answer a recorded question: transcription, answer and lang_detected, plus the answer as audio_base64"""
+    if not VOICE_ENABLED:
+        raise HTTPException(status_code=404, detail="Voice chat is disabled")
+    data = await audio.read()
+    if len(data) > MAX_VOICE_BYTES:
+        raise HTTPException(status_code=413, detail=f"Recordings are limited to {MAX_VOICE_BYTES} bytes")
+    msg = Message(text="", session_id=session_id, patientId=patientId, doctorId=doctorId)
+
+    async def answer_text(question, stats):
+        # Only the text stage takes an admission slot; decoding and recognition have their own pools
+        with span(stats, "admission"):
+            ticket = await admission.acquire(msg.priority_class())
+        async with ticket:
+            return await aget_chatbot_response(question, msg.session_key(), stats)
+
+    stats = {}
+    result = await _voice().aanswer(data, answer_text, stats, speak=speak)
+    if _wants_timing(request):
+        response.headers["Server-Timing"] = server_timing(stats)
+    return {**result, "stats": stats}
+
+class BatchRequest(BaseModel):
+    texts: List[str]
+
+MAX_BATCH_SIZE = int(os.environ.get("CHATBOT_MAX_BATCH", "256"))
+
+@app.post("/assistance/batch")
+async def chat_batch(batch: BatchRequest):
+    """Answer many independent questions; results come back in input order"""
+    if len(batch.texts) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} texts per batch")
+    stats = {}
+    async with await admission.acquire("batch"):
+        results = await abatch_chatbot_responses(batch.texts, stats)
+    return {
+        "results": [
+            {"error": f"{type(r).__name__}: {r}"} if isinstance(r, BaseException) else {"reply": r}
+            for r in results
+        ],
+        "stats": stats,
+    }
+
+def _sse(data, event=None):
+    """Format one Server-Sent-Events message"""
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n" if event else f"data: {payload}\n\n"
+
+@app.post("/assistance/stream")
+async def chat_stream(msg: Message, request: Request):
+    """Stream the reply as SSE: `data: {"token": ...}` events, then one `event: done`"""
+    stats = {}
+    # Admit before the response starts, so a shed request still gets a 429/503 status
+    with span(stats, "admission"):
+        ticket = await admission.acquire(msg.priority_class())
+
+    async def events():
+        parts = []
+        stream = astream_chatbot_response(msg.text, msg.session_key(), stats)
+        try:
+            async with aclosing(stream):
+                async for token in stream:
+                    if await request.is_disconnected():
+                        # Closing the stream stops generation; the turn is not saved
+                        return
+                    parts.append(token)
+                    yield _sse({"token": token})
+        finally:
+            ticket.release()
+        yield _sse({"reply": "".join(parts), "stats": stats}, event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also frees the slot if the body is never iterated
+        background=BackgroundTask(ticket.release),
+    )
+
+@app.delete("/assistance/session/{session_id}")
+def clear_session(session_id: str):
+    # Plain def: FastAPI runs it on its thread pool, since clearing waits on the history store
+    clear_chat_history(session_id)
+    return {"cleared": session_id}
+
+@app.get("/assistance/sessions")
+async def session_stats():
+    return get_session_stats()
+
+@app.get("/assistance/cache")
+async def cache_stats():
+    return get_cache_stats()
+
+@app.get("/assistance/admission")
+async def admission_stats():
+    return admission.stats()
+
+@app.get("/assistance/llm")
+async def llm_stats():
+    return get_llm_stats()
+
+@app.get("/assistance/embedding")
+async def embedding_stats():
+    return get_embedding_stats()
+
+@app.get("/assistance/voice")
+async def voice_stats():
+    return voice_pipeline.stats() if voice_pipeline else {}
+
+def _require_admin(token):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set CHATBOT_ADMIN_TOKEN")
+    # Constant time, so the token cannot be guessed from response timings; bytes, since headers may be non-ASCII
+    if not hmac.compare_digest((token or "").encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+    if not get_index_status():
+        raise HTTPException(status_code=503, detail="Chatbot is still starting")
+
+class IndexSwap(BaseModel):
+    version: Optional[str] = None
+
+@app.get("/admin/index")
+async def index_status(x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    return get_index_status()
+
+@app.post("/admin/index/swap")
+async def index_swap(body: IndexSwap, x_admin_token: Optional[str] = Header(None)):
+    """Warm up and serve a snapshot (default: the newest); other workers follow via CURRENT"""
+    _require_admin(x_admin_token)
+    return await aactivate_index(body.version)
+
+@app.post("/admin/index/rollback")
+async def index_rollback(x_admin_token: Optional[str] = Header(None)):
+    """Serve the previous snapshot again"""
+    _require_admin(x_admin_token)
+    return await arollback_index()
+
+Gauge(REGISTRY, "chatbot_admission_active", "Requests holding an admission slot",
+      collect=lambda: {(): admission.active})
+Gauge(REGISTRY, "chatbot_admission_queue_depth", "Requests waiting for an admission slot",
+      collect=lambda: {(): admission.stats()["queue_depth"]})
+Gauge(REGISTRY, "chatbot_admission_shed", "Requests shed since start, by reason", ("reason",),
+      collect=lambda: {(reason,): n for reason, n in admission.shed.items()})
+Gauge(REGISTRY, "chatbot_sessions", "Conversation sessions held in memory",
+      collect=lambda: {(): get_session_stats().get("sessions", 0)})
+Gauge(REGISTRY, "chatbot_history_write_queue", "History writes waiting for the next batched commit",
+      collect=lambda: {(): (get_session_stats().get("backend") or {}).get("queued", 0)})
+Gauge(REGISTRY, "chatbot_answer_cache_entries", "Entries in the semantic answer cache",
+      collect=lambda: {(): get_cache_stats().get("entries", 0)})
+Gauge(REGISTRY, "chatbot_llm_breaker_open", "1 while the medical model's circuit breaker is open",
+      collect=lambda: {(): int(get_llm_stats().get("breaker", {}).get("state") == "open")})
+Gauge(REGISTRY, "chatbot_process_memory_bytes", "This worker's memory: rss, pss, and the shared and private parts of rss",
+      ("kind",), collect=metrics.process_memory)
+Gauge(REGISTRY, "chatbot_tts_cache_bytes", "Synthesized answer audio held in the TTS cache",
+      collect=lambda: {(): voice_pipeline.audio_cache.bytes if voice_pipeline else 0})
+def _index_swaps():
+    status = get_index_status()
+    return {("ok",): status.get("swaps", 0), ("failed",): status.get("failures", 0)}
+
+Gauge(REGISTRY, "chatbot_index_swaps", "Index snapshot swaps in this worker, by outcome", ("outcome",),
+      collect=_index_swaps)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus text exposition of this worker's metrics"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
@@ -0,0 +1,230 @@
+"""In-process metrics with Prometheus text exposition, and per-request timing spans.
+
+Requests record stage timings into their stats dict with span(); once a
+request finishes, observe_request() folds those into the histograms served
+at /metrics. Everything lives in this process, so with several workers each
+one exports its own series.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers sub-millisecond routing up to the LLM latency budget
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(labelnames, values):
+    if not labelnames:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, registry, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_label_str(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Value read from a callback at scrape time; the callback returns {label tuple: value}"""
+    kind = "gauge"
+
+    def __init__(self, registry, name, help_text, labelnames=(), collect=None):
+        super().__init__(registry, name, help_text, labelnames)
+        self.collect = collect
+
+    def render(self):
+        try:
+            values = self.collect() if self.collect else {}
+        except Exception:
+            values = {}
+        return self.header() + [
+            f"{self.name}{_label_str(self.labelnames, k)} {v}" for k, v in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = entry[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        names = self.labelnames + ("le",)
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_label_str(names, key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_label_str(names, key + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = Histogram(
+    REGISTRY, "chatbot_request_seconds", "End-to-end chatbot pipeline latency",
+    ("kind", "route", "served_by", "cache"),
+)
+STAGE_SECONDS = Histogram(
+    REGISTRY, "chatbot_stage_seconds", "Latency of each pipeline stage", ("stage", "route"),
+)
+HTTP_SECONDS = Histogram(
+    REGISTRY, "chatbot_http_request_seconds", "HTTP request latency by route template", ("method", "path", "status"),
+)
+TOKENS = Histogram(
+    REGISTRY, "chatbot_tokens", "Prompt and completion tokens per model call", ("kind",), buckets=TOKEN_BUCKETS,
+)
+REQUESTS = Counter(
+    REGISTRY, "chatbot_requests_total", "Answered chatbot requests", ("kind", "route", "served_by", "cache"),
+)
+ERRORS = Counter(
+    REGISTRY, "chatbot_errors_total", "Pipeline errors by stage and exception class", ("stage", "error"),
+)
+EMBED_BATCH_SIZE = Histogram(
+    REGISTRY, "chatbot_embed_batch_size", "Queries embedded per model call by the micro-batcher",
+    buckets=BATCH_BUCKETS,
+)
+EMBED_QUEUE_SECONDS = Histogram(
+    REGISTRY, "chatbot_embed_queue_seconds", "Time a query waited for its embedding batch to start",
+)
+COALESCED = Counter(
+    REGISTRY, "chatbot_coalesced_total", "Requests answered by an identical in-flight request",
+)
+
+
+def process_memory():
+    """{(kind,): bytes} for this process from /proc/self/smaps_rollup (Linux only).
+
+    pss splits each shared page between the processes mapping it, so the sum
+    over gunicorn workers is what they really cost; shared counts pages other
+    processes also map, e.g. model weights inherited copy-on-write from the master.
+    """
+    fields = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if value.strip().endswith("kB"):
+                    fields[name] = int(value.split()[0]) * 1024
+    except (OSError, ValueError):
+        return {}
+    return {
+        ("rss",): fields.get("Rss", 0),
+        ("pss",): fields.get("Pss", 0),
+        ("shared",): fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        ("private",): fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+@contextmanager
+def span(stats, stage):
+    """Time a pipeline stage into stats["timings_ms"]; a failing stage is noted in stats["failed_stage"]"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stats.setdefault("failed_stage", stage)
+        raise
+    finally:
+        timings = stats.setdefault("timings_ms", {})
+        timings[stage] = timings.get(stage, 0.0) + (time.perf_counter() - started) * 1000
+
+
+def record_error(stats, exc):
+    """Note an exception class on the request and count it"""
+    stats["error"] = type(exc).__name__
+    ERRORS.inc(stage=stats.get("failed_stage", "unknown"), error=stats["error"])
+
+
+def observe_request(stats, seconds, kind="single"):
+    """Fold one finished request's stats into the aggregate metrics"""
+    labels = dict(
+        kind=kind,
+        route=stats.get("route", "none"),
+        served_by=stats.get("served_by", "none"),
+        cache=stats.get("cache", "none"),
+    )
+    REQUEST_SECONDS.observe(seconds, **labels)
+    REQUESTS.inc(**labels)
+    if stats.get("coalesced"):
+        # The stages ran once for the request this one joined; do not count them twice
+        COALESCED.inc()
+        return
+    for stage, ms in stats.get("timings_ms", {}).items():
+        STAGE_SECONDS.observe(ms / 1000, stage=stage, route=labels["route"])
+    for token_kind in ("prompt", "completion"):
+        tokens = stats.get(f"{token_kind}_tokens")
+        if tokens is not None:
+            TOKENS.observe(tokens, kind=token_kind)
+
+
+def server_timing(stats):
+    """Server-Timing header value for a request's stage timings"""
+    return ", ".join(f"{stage};dur={ms:.1f}" for stage, ms in stats.get("timings_ms", {}).items())
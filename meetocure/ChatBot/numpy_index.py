@@ -0,0 +1,141 @@
+"""Memory-mapped exact vector index.
+
+Layout of an index directory:
+    vectors.npy   N x D normalized embeddings (float32, float16 or int8)
+    scales.npy    per-row dequantization scale (int8 only)
+    texts.bin     chunk texts, UTF-8, concatenated
+    offsets.npy   N + 1 byte offsets into texts.bin
+    chunks.json   chunk ids and metadata, in row order
+
+Everything is opened read-only with mmap, so every worker process on the
+host shares the same physical pages through the OS page cache.
+"""
+import json
+import os
+
+import numpy as np
+
+VECTORS_FILE = "vectors.npy"
+SCALES_FILE = "scales.npy"
+TEXTS_FILE = "texts.bin"
+OFFSETS_FILE = "offsets.npy"
+CHUNKS_FILE = "chunks.json"
+DTYPES = ("float32", "float16", "int8")
+
+# Rows scored per block when the stored dtype has to be widened to float32
+BLOCK_ROWS = 16384
+
+
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class NumpyIndexWriter:
+    """Append chunks and vectors, then write the final index files on close()"""
+
+    def __init__(self, directory, dtype="float32"):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}")
+        self.directory = directory
+        self.dtype = dtype
+        os.makedirs(directory, exist_ok=True)
+        self._raw_path = os.path.join(directory, "vectors.f32.tmp")
+        self._raw = open(self._raw_path, "wb")
+        self._texts = open(os.path.join(directory, TEXTS_FILE), "wb")
+        self._offsets = [0]
+        self._chunks = {"ids": [], "metadata": []}
+        self._dim = None
+
+    def add(self, ids, vectors, texts, metadatas):
+        vectors = normalize_rows(vectors)
+        if self._dim is None:
+            self._dim = vectors.shape[1]
+        self._raw.write(vectors.tobytes())
+        for text in texts:
+            data = text.encode("utf-8")
+            self._texts.write(data)
+            self._offsets.append(self._offsets[-1] + len(data))
+        self._chunks["ids"].extend(ids)
+        self._chunks["metadata"].extend(metadatas)
+
+    def close(self):
+        self._raw.close()
+        self._texts.close()
+        rows = len(self._chunks["ids"])
+        dim = self._dim or 0
+        raw = np.memmap(self._raw_path, dtype=np.float32, mode="r", shape=(rows, dim)) if rows else np.zeros((0, dim), np.float32)
+
+        out = np.lib.format.open_memmap(
+            os.path.join(self.directory, VECTORS_FILE), mode="w+", dtype=np.dtype(self.dtype), shape=(rows, dim)
+        )
+        if self.dtype == "int8":
+            scales = np.abs(raw).max(axis=1) / 127.0 if rows else np.zeros(0, np.float32)
+            scales[scales == 0] = 1.0
+            for start in range(0, rows, BLOCK_ROWS):
+                block = raw[start:start + BLOCK_ROWS] / scales[start:start + BLOCK_ROWS, None]
+                out[start:start + BLOCK_ROWS] = np.round(block).astype(np.int8)
+            np.save(os.path.join(self.directory, SCALES_FILE), scales.astype(np.float32))
+        else:
+            for start in range(0, rows, BLOCK_ROWS):
+                out[start:start + BLOCK_ROWS] = raw[start:start + BLOCK_ROWS]
+        out.flush()
+        del out, raw
+
+        np.save(os.path.join(self.directory, OFFSETS_FILE), np.asarray(self._offsets, dtype=np.int64))
+        with open(os.path.join(self.directory, CHUNKS_FILE), "w", encoding="utf-8") as f:
+            json.dump(self._chunks, f, ensure_ascii=False)
+        os.remove(self._raw_path)
+
+
+class NumpyIndex:
+    """Exact top-k cosine search over a memory-mapped index directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode="r")
+        scales_path = os.path.join(directory, SCALES_FILE)
+        self.scales = np.load(scales_path, mmap_mode="r") if os.path.exists(scales_path) else None
+        self.offsets = np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode="r")
+        self._texts = np.memmap(os.path.join(directory, TEXTS_FILE), dtype=np.uint8, mode="r") \
+            if self.offsets[-1] else np.zeros(0, np.uint8)
+        with open(os.path.join(directory, CHUNKS_FILE), encoding="utf-8") as f:
+            chunks = json.load(f)
+        self.ids = chunks["ids"]
+        self.metadata = chunks["metadata"]
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def text(self, row):
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return bytes(self._texts[start:end]).decode("utf-8")
+
+    def scores(self, queries):
+        """Cosine scores of normalized queries (Q x D) against every row (Q x N)"""
+        queries = normalize_rows(np.atleast_2d(queries))
+        if self.vectors.dtype == np.float32:
+            return queries @ self.vectors.T
+
+        out = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+        for start in range(0, len(self), BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + BLOCK_ROWS], dtype=np.float32)
+            out[:, start:start + BLOCK_ROWS] = queries @ block.T
+        if self.scales is not None:
+            out *= self.scales
+        return out
+
+    def search(self, queries, k):
+        """Top-k (row, score) lists for each query, best first"""
+        scores = self.scores(queries)
+        k = min(k, scores.shape[1])
+        if k == 0:
+            return [[] for _ in range(scores.shape[0])]
+        results = []
+        for row_scores in scores:
+            top = np.argpartition(-row_scores, k - 1)[:k]
+            top = top[np.argsort(-row_scores[top])]
+            results.append([(int(i), float(row_scores[i])) for i in top])
+        return results
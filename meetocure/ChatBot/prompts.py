@@ -0,0 +1,48 @@
+"""System prompts for the medical model.
+
+The instructions for each language are fixed strings built once at import, and
+every prompt starts with them: providers that cache prompt prefixes can reuse
+the instruction tokens across requests, and the per-request parts (history,
+then retrieved context) follow. The question itself is only sent as the
+user message.
+"""
+
+INSTRUCTIONS = {
+    "en": """You are a knowledgeable AI medical assistant.
+Always reply clearly in English.
+Keep the answer short (1-2 sentences) but meaningful.
+
+Instructions:
+- Answer the user's question using the context information and previous conversation below.
+- Answer only in English.
+- Keep the answer short (1-2 sentences) but complete.
+- Never stop in the middle of a sentence.
+- Explain complex medical terms in simple words.""",
+    "te": """మీరు ఒక జ్ఞానపూర్వక AI వైద్య సహాయకుడిగా వ్యవహరించాలి.
+ఎల్లప్పుడూ తెలుగు లో స్పష్టంగా మరియు స్నేహపూర్వకంగా సమాధానం ఇవ్వండి.
+సమాధానం చిన్నదిగా (1-2 వాక్యాలు) కానీ అర్థవంతంగా ఉండాలి.
+
+సూచనలు:
+- క్రింది సందర్భ సమాచారం మరియు మునుపటి సంభాషణ ఆధారంగా వినియోగదారుడి ప్రశ్నకు సమాధానం ఇవ్వండి.
+- తెలుగు లోనే సమాధానం ఇవ్వాలి.
+- సమాధానం చిన్నదిగా (1-2 వాక్యాలు) కానీ పూర్తిగా ఉండాలి.
+- ఎప్పుడూ వాక్యం మధ్యలో ఆపకండి
+- క్లిష్ట పదాలను సులభంగా వివరించాలి.""",
+}
+
+HISTORY_HEADERS = {"en": "Previous conversation:", "te": "మునుపటి సంభాషణ:"}
+CONTEXT_HEADERS = {"en": "Context information from documents:", "te": "పత్రాల నుండి సందర్భ సమాచారం:"}
+
+
+def prompt_language(language):
+    return "te" if language in ("te", "te_transliterated") else "en"
+
+
+def system_prompt(language, context, chat_history=""):
+    """Fixed instructions first, then the conversation so far, then the retrieved context"""
+    lang = prompt_language(language)
+    parts = [INSTRUCTIONS[lang]]
+    if chat_history:
+        parts.append(f"{HISTORY_HEADERS[lang]}\n{chat_history}")
+    parts.append(f"{CONTEXT_HEADERS[lang]}\n{context}")
+    return "\n\n".join(parts)
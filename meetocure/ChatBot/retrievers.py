@@ -0,0 +1,194 @@
+"""Pluggable retrieval backends.
+
+Every backend answers `search(query, vector, k)` and
+`search_batch(queries, vectors, k)` with langchain Documents, so
+MedicalAssistant does not care where chunks live. Select one with
+CHATBOT_RETRIEVER=chroma|numpy|hybrid.
+"""
+import os
+
+from langchain_core.documents import Document
+
+import index_store
+from bm25_index import BM25Index
+from numpy_index import NumpyIndex
+from title_index import TitleIndex
+
+# Backends made of read-only files and memory maps, safe to open in the gunicorn
+# master and share with forked workers. Chroma holds SQLite connections, which are not.
+FORK_SAFE_BACKENDS = ("numpy", "hybrid")
+
+
+def configured_backend():
+    return os.environ.get("CHATBOT_RETRIEVER", "chroma")
+
+
+class ChromaRetriever:
+    """Chroma persistent store (SQLite + HNSW)"""
+
+    name = "chroma"
+
+    def __init__(self, path, embeddings):
+        from langchain_community.vectorstores import Chroma
+
+        self.vectorstore = Chroma(
+            persist_directory=path,
+            embedding_function=embeddings,
+            collection_name=index_store.COLLECTION_NAME,
+        )
+
+    def search(self, query, vector, k):
+        return self.vectorstore.similarity_search_by_vector(vector, k)
+
+    def search_batch(self, queries, vectors, k):
+        result = self.vectorstore._collection.query(
+            query_embeddings=[list(map(float, v)) for v in vectors],
+            n_results=k,
+            include=["documents", "metadatas"],
+        )
+        return [
+            [Document(page_content=text, metadata=meta or {}) for text, meta in zip(texts, metas)]
+            for texts, metas in zip(result["documents"], result["metadatas"])
+        ]
+
+
+class NumpyRetriever:
+    """Memory-mapped exact search, see numpy_index.py"""
+
+    name = "numpy"
+
+    def __init__(self, path):
+        self.index = NumpyIndex(path)
+
+    def _documents(self, hits):
+        return [
+            Document(
+                page_content=self.index.text(row),
+                metadata={**self.index.metadata[row], "id": self.index.ids[row], "score": score},
+            )
+            for row, score in hits
+        ]
+
+    def search(self, query, vector, k):
+        return self._documents(self.index.search(vector, k)[0])
+
+    def search_batch(self, queries, vectors, k):
+        return [self._documents(hits) for hits in self.index.search(vectors, k)]
+
+
+class HybridRetriever(NumpyRetriever):
+    """BM25 + exact vector search fused with reciprocal rank fusion.
+
+    Candidates below both relevance cutoffs (cosine similarity and a fraction
+    of the best BM25 score) are dropped, so fewer, better chunks reach the prompt.
+    """
+
+    name = "hybrid"
+
+    def __init__(self, path, bm25_path, candidates=20, rrf_k=60, min_similarity=0.3, min_bm25_ratio=0.4):
+        super().__init__(path)
+        self.bm25 = BM25Index(bm25_path)
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.min_similarity = min_similarity
+        self.min_bm25_ratio = min_bm25_ratio
+
+    def _fuse(self, query, vector_hits, k):
+        keyword_hits = self.bm25.search(query, self.candidates) if query else []
+        best_bm25 = keyword_hits[0][1] if keyword_hits else 0.0
+
+        fused = {}
+        similarity = {}
+        bm25 = {}
+        for rank, (row, score) in enumerate(vector_hits):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+            similarity[row] = score
+        for rank, (row, score) in enumerate(keyword_hits):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+            bm25[row] = score
+
+        ranked = sorted(fused, key=fused.get, reverse=True)
+        kept = [
+            row for row in ranked
+            if similarity.get(row, 0.0) >= self.min_similarity
+            or (best_bm25 and bm25.get(row, 0.0) >= self.min_bm25_ratio * best_bm25)
+        ]
+        return [(row, fused[row]) for row in kept[:k]]
+
+    def search(self, query, vector, k):
+        vector_hits = self.index.search(vector, self.candidates)[0]
+        return self._documents(self._fuse(query, vector_hits, k))
+
+    def search_batch(self, queries, vectors, k):
+        all_hits = self.index.search(vectors, self.candidates)
+        return [
+            self._documents(self._fuse(query, hits, k))
+            for query, hits in zip(queries, all_hits)
+        ]
+
+
+class TitleLookupRetriever:
+    """Answer encyclopedia title queries from the title index, else defer to the wrapped backend"""
+
+    def __init__(self, base, numpy_path, titles_path):
+        self.base = base
+        self.name = base.name
+        self.index = NumpyIndex(numpy_path)
+        self.titles = TitleIndex(titles_path)
+        self.hits = 0
+
+    def _lookup(self, query, k):
+        found = self.titles.lookup(query) if query else None
+        if found is None:
+            return None
+        title, rows, match = found
+        self.hits += 1
+        return [
+            Document(
+                page_content=self.index.text(row),
+                metadata={**self.index.metadata[row], "id": self.index.ids[row], "match": match},
+            )
+            for row in rows[:k]
+        ]
+
+    def search(self, query, vector, k):
+        docs = self._lookup(query, k)
+        return docs if docs is not None else self.base.search(query, vector, k)
+
+    def search_batch(self, queries, vectors, k):
+        results = [self._lookup(query, k) for query in queries]
+        missing = [i for i, docs in enumerate(results) if docs is None]
+        if missing:
+            found = self.base.search_batch([queries[i] for i in missing], [vectors[i] for i in missing], k)
+            for i, docs in zip(missing, found):
+                results[i] = docs
+        return results
+
+
+def open_retriever(snapshot_path, embeddings, backend=None):
+    """Open the configured backend for a snapshot directory.
+
+    Snapshots built with entry-aware chunking also get the title lookup path
+    in front of the backend.
+    """
+    retriever = _open_backend(snapshot_path, embeddings, backend)
+    titles_path = os.path.join(snapshot_path, index_store.TITLES_DIR)
+    if os.path.isdir(titles_path) and os.environ.get("CHATBOT_TITLE_LOOKUP", "1") == "1":
+        retriever = TitleLookupRetriever(retriever, os.path.join(snapshot_path, index_store.NUMPY_DIR), titles_path)
+    return retriever
+
+
+def _open_backend(snapshot_path, embeddings, backend=None):
+    backend = backend or configured_backend()
+    if backend == "numpy":
+        return NumpyRetriever(os.path.join(snapshot_path, index_store.NUMPY_DIR))
+    if backend == "hybrid":
+        return HybridRetriever(
+            os.path.join(snapshot_path, index_store.NUMPY_DIR),
+            os.path.join(snapshot_path, index_store.BM25_DIR),
+            min_similarity=float(os.environ.get("CHATBOT_HYBRID_MIN_SIMILARITY", "0.3")),
+            min_bm25_ratio=float(os.environ.get("CHATBOT_HYBRID_MIN_BM25_RATIO", "0.4")),
+        )
+    if backend == "chroma":
+        return ChromaRetriever(os.path.join(snapshot_path, index_store.CHROMA_DIR), embeddings)
+    raise ValueError(f"Unknown retriever backend {backend!r}")
@@ -0,0 +1,123 @@
+"""Single-pass intent and language router.
+
+All patterns are compiled once into one alternation, so routing a message is
+one regex scan plus a cached lookup. Greetings, thanks and goodbyes get a
+canned, localized reply without any LLM call.
+"""
+import re
+from functools import lru_cache
+
+# Order matters: at each position the first matching group wins
+ROUTER_RE = re.compile(
+    r"(?P<te_greeting>నమస్కారం|నమస్తే|హలో)"
+    r"|(?P<te_thanks>ధన్యవాదాలు)"
+    r"|(?P<telugu_script>[\u0c00-\u0c7f]+)"
+    r"|\b(?P<te_wellbeing>ela\s+unnaa?v|baagunnava|ela\s+undi)\b"
+    r"|\b(?P<wellbeing>how\s+are\s+you|how\s+r\s+u|whats\s+up|wassup|sup)\b"
+    r"|\b(?P<greeting>hi|hello|hey|hola|namaste|namaskaram|vanakkam|good\s+(?:morning|evening|afternoon))\b"
+    r"|\b(?P<thanks>thank\s+you|thanks|thx|dhanyavadalu)\b"
+    r"|\b(?P<goodbye>goodbye|bye|see\s+you)\b"
+    r"|\b(?P<translit>ela|em\s+cheyali|em\s+chesav|eppudu|ekkada|entha|enduku|nenu|meeru|memu|vaaru|"
+    r"iddaru|mana|cheppu|cheppandi|kavali|undi|ledhu|avunu|kadhu)\b"
+)
+
+# A message made only of these (casual phrases, filler words, punctuation) is small talk
+CASUAL_ONLY_RE = re.compile(
+    r"(?:నమస్కారం|నమస్తే|హలో|ధన్యవాదాలు|డాక్టర్|గారు|అండి|చాలా"
+    r"|\b(?:ela\s+unnaa?v|baagunnava|ela\s+undi"
+    r"|how\s+are\s+you|how\s+r\s+u|whats\s+up|wassup|sup"
+    r"|hi|hello|hey|hola|namaste|namaskaram|vanakkam|good\s+(?:morning|evening|afternoon)"
+    r"|thank\s+you|thanks|thx|dhanyavadalu|goodbye|bye|see\s+you"
+    r"|there|doctor|doc|dr|sir|madam|dear|friend|buddy|everyone|all|bot|assistant|garu|andi"
+    r"|so|very|much|a\s+lot|again|and|ok|okay|for|the|your|my|help|today|doing)\b"
+    r"|[\s\W_])+"
+)
+
+TELUGU_SCRIPT_GROUPS = frozenset({"te_greeting", "te_thanks", "telugu_script"})
+TRANSLITERATED_GROUPS = frozenset({"te_wellbeing", "translit"})
+
+# Group -> intent, in priority order when a message matches several
+INTENT_GROUPS = (
+    ("te_wellbeing", "wellbeing"),
+    ("wellbeing", "wellbeing"),
+    ("goodbye", "goodbye"),
+    ("te_thanks", "thanks"),
+    ("thanks", "thanks"),
+    ("te_greeting", "greeting"),
+    ("greeting", "greeting"),
+)
+
+# Trailing punctuation and spacing do not change what a question asks
+QUESTION_TRIM_RE = re.compile(r"[\s?!.,;:]+$")
+
+# Messages longer than this are treated as questions even if they contain a greeting
+CASUAL_MAX_WORDS = 6
+CANNED_MAX_WORDS = 4
+
+CANNED_RESPONSES = {
+    "greeting": {
+        "en": "Hello! I'm your medical assistant. How can I help you today?",
+        "te": "నమస్కారం! నేను మీ వైద్య సహాయకుడిని. ఈ రోజు మీకు ఎలా సహాయం చేయగలను?",
+    },
+    "wellbeing": {
+        "en": "I'm doing well, thank you! How are you feeling today?",
+        "te": "నేను బాగున్నాను, ధన్యవాదాలు! మీరు ఈ రోజు ఎలా ఉన్నారు?",
+    },
+    "thanks": {
+        "en": "You're welcome! Take care of your health.",
+        "te": "మీకు స్వాగతం! మీ ఆరోగ్యాన్ని జాగ్రత్తగా చూసుకోండి.",
+    },
+    "goodbye": {
+        "en": "Goodbye! Stay healthy.",
+        "te": "వీడ్కోలు! ఆరోగ్యంగా ఉండండి.",
+    },
+}
+
+
+class Route:
+    __slots__ = ("language", "intent", "canned")
+
+    def __init__(self, language, intent, canned=None):
+        self.language = language
+        self.intent = intent
+        self.canned = canned
+
+    @property
+    def is_casual(self):
+        return self.intent != "medical"
+
+    def __repr__(self):
+        return f"Route(language={self.language!r}, intent={self.intent!r})"
+
+
+@lru_cache(maxsize=4096)
+def route_message(text):
+    """Classify text into (language, intent); deterministic and cached"""
+    lowered = text.lower().strip()
+    found = {match.lastgroup for match in ROUTER_RE.finditer(lowered)}
+
+    if found & TELUGU_SCRIPT_GROUPS:
+        language = "te"
+    elif found & TRANSLITERATED_GROUPS:
+        language = "te_transliterated"
+    else:
+        language = "en"
+
+    words = len(lowered.split())
+    intent = "medical"
+    # "hi, what causes fever" is a question: anything besides casual phrases and filler is routed as one
+    if words <= CASUAL_MAX_WORDS and CASUAL_ONLY_RE.fullmatch(lowered):
+        for group, name in INTENT_GROUPS:
+            if group in found:
+                intent = name
+                break
+
+    canned = None
+    if intent != "medical" and words <= CANNED_MAX_WORDS:
+        canned = CANNED_RESPONSES[intent]["en" if language == "en" else "te"]
+    return Route(language, intent, canned)
+
+
+def normalize_question(text):
+    """Case- and spacing-insensitive form of a question, for exact-match keys"""
+    return QUESTION_TRIM_RE.sub("", " ".join(text.lower().split()))
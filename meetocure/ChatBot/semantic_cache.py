@@ -0,0 +1,119 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Words that usually point back at an earlier turn ("is it contagious?", "what about those?")
+FOLLOW_UP_RE = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|their|he|she|his|her|above|same|more|else|also|again)\b",
+    re.IGNORECASE,
+)
+
+
+def is_history_dependent(text, has_history):
+    """Whether the answer to text likely depends on the previous turns"""
+    if not has_history:
+        return False
+    return len(text.split()) <= 3 or FOLLOW_UP_RE.search(text) is not None
+
+
+class SemanticCache:
+    """Answer cache keyed by question embedding and language, with LRU/TTL eviction"""
+
+    def __init__(self, dim, max_entries=2000, threshold=0.9, ttl_seconds=24 * 3600):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+
+        # Vectors live in one preallocated matrix so a lookup is a single mat-vec product
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._languages = np.full(max_entries, -1, dtype=np.int16)  # -1 marks a free slot
+        self._language_ids = {}
+        self._entries = OrderedDict()  # slot -> (answer, created_at), in LRU order
+        self._free = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _release(self, slot):
+        self._entries.pop(slot, None)
+        self._languages[slot] = -1
+        self._free.append(slot)
+
+    def lookup(self, vector, language):
+        """Return a cached answer for a similar question in the same language, or None"""
+        query = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            language_id = self._language_ids.get(language)
+            if language_id is None:
+                self.misses += 1
+                return None
+
+            scores = self._vectors @ query
+            scores[self._languages != language_id] = -1.0
+
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                self.misses += 1
+                return None
+
+            answer, created_at = self._entries[slot]
+            if now - created_at > self.ttl_seconds:
+                self._release(slot)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(slot)
+            self.hits += 1
+            return answer
+
+    def store(self, vector, language, answer):
+        with self._lock:
+            if not self._free:
+                oldest = next(iter(self._entries))
+                self._release(oldest)
+                self.evictions += 1
+            slot = self._free.pop()
+            self._vectors[slot] = self._normalize(vector)
+            self._languages[slot] = self._language_ids.setdefault(language, len(self._language_ids))
+            self._entries[slot] = (answer, time.time())
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def clear(self):
+        with self._lock:
+            for slot in list(self._entries):
+                self._release(slot)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "threshold": self.threshold,
+            }
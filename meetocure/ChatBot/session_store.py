@@ -0,0 +1,257 @@
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class Turn:
+    """One question/answer exchange, kept as a compact record"""
+    __slots__ = ("question", "answer", "created_at")
+
+    def __init__(self, question, answer, created_at=None):
+        self.question = question
+        self.answer = answer
+        self.created_at = created_at if created_at is not None else time.time()
+
+    def size_bytes(self):
+        return sys.getsizeof(self.question) + sys.getsizeof(self.answer) + 64
+
+
+class Session:
+    """Conversation state for a single user"""
+    __slots__ = ("key", "turns", "pending", "summary", "summarizing", "last_seen", "size_bytes",
+                 "version", "unsynced", "start")
+
+    def __init__(self, key, max_turns):
+        self.key = key
+        self.turns = deque(maxlen=max_turns)
+        # Turns moved out of the verbatim window, waiting to be folded into summary
+        self.pending = deque(maxlen=max_turns)
+        self.summary = ""
+        self.summarizing = False
+        self.last_seen = time.monotonic()
+        self.size_bytes = 0
+        # With a durable backend: the version on disk once this worker's queued writes land, and how many are queued
+        self.version = 0
+        self.unsynced = 0
+        # Position in the whole conversation of the oldest turn kept (pending, else turns)
+        self.start = 0
+
+    def history_str(self):
+        return "\n".join(f"Human: {t.question}\nAI: {t.answer}" for t in self.turns)
+
+
+class SessionView:
+    """Copy of a session's history taken under the store lock, safe to read while turns are appended"""
+    __slots__ = ("key", "turns", "pending", "summary", "start")
+
+    def __init__(self, session):
+        self.key = session.key
+        self.start = session.start
+        self.turns = tuple(session.turns)
+        self.pending = tuple(session.pending)
+        self.summary = session.summary
+
+
+class SessionStore:
+    """Bounded per-user session store with LRU and idle-TTL eviction.
+
+    With a backend (see history_store.py) this is a cache of the durable
+    history: sessions are loaded on first use, every change is also queued
+    for disk, and a cached session is reloaded when another worker changed it.
+    """
+
+    def __init__(self, max_sessions=1000, ttl_seconds=1800, max_turns=20, max_bytes=64 * 1024 * 1024,
+                 backend=None):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_turns = max_turns
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.backend = backend
+        self.total_bytes = 0
+        self.evicted = 0
+        self.expired = 0
+        self.reloads = 0
+
+    def _drop(self, key):
+        session = self._sessions.pop(key)
+        self.total_bytes -= session.size_bytes
+
+    def _resize(self, session, delta):
+        session.size_bytes += delta
+        if self._sessions.get(session.key) is session:
+            self.total_bytes += delta
+
+    def _fold(self, session):
+        turn = session.turns.popleft()
+        if len(session.pending) == session.pending.maxlen:
+            # The summarizer fell too far behind; the oldest turn is lost
+            self._resize(session, -session.pending[0].size_bytes())
+            session.start += 1
+        session.pending.append(turn)
+
+    def _evict(self, now):
+        # Sessions are kept in last-access order, so idle ones sit at the front
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if now - session.last_seen <= self.ttl_seconds:
+                break
+            self._drop(key)
+            self.expired += 1
+
+        while len(self._sessions) > self.max_sessions or (
+            self._sessions and self.total_bytes > self.max_bytes
+        ):
+            self._drop(next(iter(self._sessions)))
+            self.evicted += 1
+
+    def _from_record(self, key, record):
+        """A new session for key, filled from the backend's copy if there is one"""
+        session = Session(key, self.max_turns)
+        if record is not None:
+            session.version = record.version
+            session.summary = record.summary
+            session.start = record.start
+            if record.summary:
+                session.size_bytes += sys.getsizeof(record.summary)
+            for question, answer, created_at in record.turns:
+                if len(session.turns) == session.turns.maxlen:
+                    # Not summarized yet; the next compaction of the history window folds them
+                    session.pending.append(session.turns.popleft())
+                turn = Turn(question, answer, created_at)
+                session.turns.append(turn)
+                session.size_bytes += turn.size_bytes()
+        return session
+
+    def _install(self, session):
+        self._sessions[session.key] = session
+        self.total_bytes += session.size_bytes
+
+    def _write(self, session, method, *args):
+        """Queue a change of session for the backend (backend.method(key, *args))"""
+        if self.backend is not None:
+            session.version += 1
+            session.unsynced += 1
+            getattr(self.backend, method)(session.key, *args, on_commit=lambda: self._synced(session))
+
+    def _synced(self, session):
+        with self._lock:
+            session.unsynced -= 1
+
+    def get(self, key):
+        """Return the session for key, loading or creating it if needed.
+
+        With a backend this reads the disk, outside the lock (other threads,
+        and /metrics on the event loop, take it too); call it off the event loop.
+        """
+        while True:
+            with self._lock:
+                cached = self._sessions.get(key)
+            record = None
+            # Only checked once this worker's own writes are on disk; the version then only moved if another worker wrote
+            if self.backend is not None and (cached is None or (
+                    cached.unsynced == 0 and self.backend.version(key) != cached.version)):
+                record = self.backend.load(key, 2 * self.max_turns)
+            with self._lock:
+                session = self._sessions.get(key)
+                if session is not cached:
+                    continue  # replaced or evicted while the disk was read; look again
+                if session is None or (record is not None and session.unsynced == 0):
+                    if session is not None:
+                        self._drop(key)
+                        self.reloads += 1
+                    session = self._from_record(key, record)
+                    self._install(session)
+                else:
+                    self._sessions.move_to_end(key)
+                session.last_seen = time.monotonic()
+                self._evict(session.last_seen)
+                return session
+
+    def peek(self, key):
+        """Return the session for key without creating or touching it"""
+        with self._lock:
+            return self._sessions.get(key)
+
+    def append(self, key, question, answer):
+        """Record a finished turn for key (reads the disk like get())"""
+        turn = Turn(question, answer)
+        session = self.get(key)
+        with self._lock:
+            current = self._sessions.get(key)
+            if current is None:
+                # Evicted since get(); the turn still belongs to it
+                self._install(session)
+            else:
+                session = current
+                self._sessions.move_to_end(key)
+
+            if len(session.turns) == session.turns.maxlen:
+                self._fold(session)
+            session.turns.append(turn)
+            self._resize(session, turn.size_bytes())
+            self._write(session, "append", question, answer, turn.created_at)
+            session.last_seen = time.monotonic()
+            self._evict(session.last_seen)
+            return session
+
+    def snapshot(self, session):
+        """SessionView of session; append() changes its deques on executor threads, so read this instead"""
+        with self._lock:
+            return SessionView(session)
+
+    def fold_oldest(self, session):
+        """Move the oldest verbatim turn of session into its pending-summary queue (the newest always stays)"""
+        with self._lock:
+            if len(session.turns) > 1:
+                self._fold(session)
+
+    def apply_summary(self, session, summary, through):
+        """Replace the rolling summary with one of the conversation's first `through` turns"""
+        with self._lock:
+            delta = (sys.getsizeof(summary) if summary else 0) - (
+                sys.getsizeof(session.summary) if session.summary else 0
+            )
+            while session.pending and session.start < through:
+                delta -= session.pending.popleft().size_bytes()
+                session.start += 1
+            session.summary = summary
+            self._resize(session, delta)
+            self._write(session, "set_summary", summary, through)
+
+    def clear(self, key=None):
+        """Forget one session, or every session when key is None"""
+        version = self.backend.version(key) if self.backend is not None and key is not None else 0
+        with self._lock:
+            if key is None:
+                self._sessions.clear()
+                self.total_bytes = 0
+            elif key in self._sessions:
+                self._drop(key)
+            if self.backend is None:
+                return
+            if key is not None:
+                # An empty placeholder until the delete is on disk, so the old turns are not loaded again
+                session = Session(key, self.max_turns)
+                session.version = version
+                self._sessions[key] = session
+                self._write(session, "clear")
+                return
+        # Rare and administrative: wait for it rather than track every session's pending delete
+        self.backend.clear()
+        self.backend.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self.total_bytes,
+                "evicted": self.evicted,
+                "expired": self.expired,
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl_seconds,
+                "reloads": self.reloads,
+                "backend": self.backend.stats() if self.backend is not None else None,
+            }
@@ -0,0 +1,62 @@
+import asyncio
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one shared call.
+
+    Callers await the shared task through asyncio.shield, so one caller
+    giving up does not cancel the work for the others; the task is only
+    cancelled once every caller waiting on it has gone.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    def _forget(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def run(self, key, factory):
+        """Return (result, coalesced) for key, starting factory() only if no call is in flight.
+
+        Exceptions raised by the shared call propagate to every caller.
+        """
+        flight = self._flights.get(key)
+        coalesced = flight is not None
+        if coalesced:
+            self.coalesced += 1
+        else:
+            flight = _Flight(asyncio.ensure_future(factory()))
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self._flights[key] = flight
+            self.leaders += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), coalesced
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody wants the result any more; new callers start a fresh flight
+                self._forget(key, flight)
+                flight.task.cancel()
+                self.abandoned += 1
+
+    def stats(self):
+        return {
+            "in_flight": len(self._flights),
+            "upstream_calls": self.leaders,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+        }
@@ -0,0 +1,186 @@
+"""In-process hot swap of immutable index snapshots.
+
+Requests take the serving snapshot with acquire() for the duration of a
+search. swap() opens a new version off the event loop, runs a warm-up query
+against it and only then makes it the serving one; searches already running
+finish on the old snapshot, which is released once the last one returns.
+The CURRENT file stays the source of truth: swaps and rollbacks requested
+here rewrite it, and watch() follows changes made by build_index.py or by
+another worker.
+"""
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+
+import index_store
+
+logger = logging.getLogger(__name__)
+
+WARMUP_QUERY = "What are the symptoms of fever?"
+
+
+class SnapshotError(Exception):
+    """A snapshot could not be opened or failed its warm-up; the serving one is unchanged"""
+
+
+class Snapshot:
+    __slots__ = ("version", "retriever", "refs", "retired", "opened_at")
+
+    def __init__(self, version, retriever):
+        self.version = version
+        self.retriever = retriever
+        self.refs = 0
+        self.retired = False
+        self.opened_at = time.time()
+
+    def release(self):
+        # Dropping the retriever unmaps its files once nothing else references them
+        self.retriever = None
+
+
+class SnapshotManager:
+    def __init__(self, open_snapshot, embeddings, run_blocking, snapshot, root=None, on_swap=None):
+        """open_snapshot(version) -> retriever runs on the executor via run_blocking; on_swap() runs after each swap"""
+        self.open_snapshot = open_snapshot
+        self.on_swap = on_swap
+        self.embeddings = embeddings
+        self.run_blocking = run_blocking
+        self.root = root
+        self.current = snapshot
+        self.previous_version = None
+        self._draining = set()
+        self._lock = None
+        self._failed = None  # version whose warm-up failed, not retried by watch() until CURRENT changes
+
+        self.swaps = 0
+        self.failures = 0
+        self.rollbacks = 0
+        self.last_error = None
+        self.last_swap = None
+
+    @property
+    def version(self):
+        return self.current.version
+
+    @contextmanager
+    def acquire(self):
+        """The serving snapshot, kept open until the block exits"""
+        snapshot = self.current
+        snapshot.refs += 1
+        try:
+            yield snapshot
+        finally:
+            snapshot.refs -= 1
+            if snapshot.retired and snapshot.refs == 0:
+                self._drop(snapshot)
+
+    def _drop(self, snapshot):
+        self._draining.discard(snapshot)
+        snapshot.release()
+        logger.info("Released index snapshot %s", snapshot.version)
+
+    def _retire(self, snapshot):
+        snapshot.retired = True
+        if snapshot.refs == 0:
+            self._drop(snapshot)
+        else:
+            self._draining.add(snapshot)
+
+    async def _warm_up(self, retriever):
+        vector = await self.run_blocking(self.embeddings.embed_query, WARMUP_QUERY)
+        docs = await self.run_blocking(retriever.search, WARMUP_QUERY, vector, 5)
+        if not docs:
+            raise SnapshotError("warm-up query returned no documents")
+
+    async def swap(self, version, reason="swap"):
+        """Open, warm up and serve version; raises SnapshotError and keeps serving the old one on failure"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if version == self.current.version:
+                return self.status()
+            started = time.perf_counter()
+            try:
+                manifest = index_store.load_manifest(version, self.root)
+                if manifest.get("embedding_model", index_store.EMBEDDING_MODEL) != index_store.EMBEDDING_MODEL:
+                    raise SnapshotError(f"{version} was embedded with {manifest['embedding_model']}")
+                retriever = await self.run_blocking(self.open_snapshot, version)
+                await self._warm_up(retriever)
+            except Exception as exc:
+                self.failures += 1
+                self._failed = version
+                self.last_error = f"{version}: {type(exc).__name__}: {exc}"
+                logger.error("Not swapping to index %s: %s", version, self.last_error)
+                if isinstance(exc, SnapshotError):
+                    raise
+                raise SnapshotError(self.last_error) from exc
+
+            old = self.current
+            self.current = Snapshot(version, retriever)
+            self.previous_version = old.version
+            self._retire(old)
+            self._failed = None
+            if self.on_swap is not None:
+                self.on_swap()
+            self.swaps += 1
+            self.last_swap = {
+                "from": old.version,
+                "to": version,
+                "reason": reason,
+                "warm_up_ms": (time.perf_counter() - started) * 1000,
+                "at": time.time(),
+            }
+            logger.info("Serving index %s (was %s, %s, warm-up %.0f ms)",
+                        version, old.version, reason, self.last_swap["warm_up_ms"])
+            return self.status()
+
+    async def activate(self, version=None):
+        """Swap to version (default: the newest built one) and point CURRENT at it"""
+        version = version or (index_store.list_versions(self.root) or [None])[-1]
+        if version is None or version not in index_store.list_versions(self.root):
+            raise SnapshotError(f"No complete snapshot {version!r} under {index_store.index_root()!r}")
+        await self.swap(version, reason="admin")
+        index_store.set_current(version, self.root)
+        return self.status()
+
+    async def rollback(self):
+        """Go back to the version served before the last swap (or the newest older one) and point CURRENT at it"""
+        versions = index_store.list_versions(self.root)
+        target = self.previous_version
+        if target is None and self.current.version in versions:
+            older = versions[:versions.index(self.current.version)]
+            target = older[-1] if older else None
+        if target is None or target not in versions:
+            raise SnapshotError("No earlier snapshot to roll back to")
+        await self.swap(target, reason="rollback")
+        index_store.set_current(target, self.root)
+        self.rollbacks += 1
+        return self.status()
+
+    async def watch(self, interval):
+        """Follow the CURRENT file: swap whenever it names a version other than the serving one"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                version = index_store.current_version(self.root)
+                if version and version != self.current.version and version != self._failed:
+                    await self.swap(version, reason="CURRENT changed")
+            except SnapshotError:
+                pass  # logged by swap(); retried once CURRENT names another version
+            except Exception:
+                logger.exception("Index watcher failed; still serving %s", self.current.version)
+
+    def status(self):
+        return {
+            "serving": self.current.version,
+            "current_file": index_store.current_version(self.root),
+            "previous": self.previous_version,
+            "in_flight": self.current.refs,
+            "draining": {s.version: s.refs for s in self._draining},
+            "swaps": self.swaps,
+            "rollbacks": self.rollbacks,
+            "failures": self.failures,
+            "last_swap": self.last_swap,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,126 @@
+"""Encyclopedia entry titles and aliases, for direct lookups like "what is asthma".
+
+titles.json maps each normalized title to the index rows of that entry's
+chunks, and each alias to its title. Exact matches are one dict lookup; fuzzy
+matches only compare against titles sharing the query's first letter.
+"""
+import difflib
+import json
+import os
+import re
+import unicodedata
+from collections import defaultdict
+
+TITLES_FILE = "titles.json"
+
+SUBJECT_RE = re.compile(
+    r"^(?:what\s+is|what\s+are|what's|whats|define|definition\s+of|meaning\s+of|"
+    r"tell\s+me\s+about|explain|info\s+on|information\s+(?:on|about))\s+"
+    r"(?:an?\s+|the\s+)?(?P<subject>.+?)\s*[?.!]*$",
+    re.IGNORECASE,
+)
+PAREN_RE = re.compile(r"\s*\(([^)]+)\)\s*")
+ALSO_CALLED_RE = re.compile(r"\b(?:also\s+(?:called|known\s+as)|sometimes\s+called)\s+([^.,;:()]+)", re.IGNORECASE)
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = re.sub(r"[^\w\s-]", " ", text)
+    return " ".join(text.split())
+
+
+def extract_subject(query):
+    """The thing a definition-style question asks about, or None"""
+    query = query.strip()
+    match = SUBJECT_RE.match(query)
+    if match:
+        return normalize(match.group("subject"))
+    # Bare topic queries such as "asthma" or "heart attack?"
+    if len(query.split()) <= 3:
+        return normalize(query)
+    return None
+
+
+def aliases_for(title, text):
+    """Alternative names of an entry: parenthesised forms, inverted titles, "also called" phrases"""
+    aliases = set()
+    for inner in PAREN_RE.findall(title):
+        aliases.add(inner)
+    bare = PAREN_RE.sub(" ", title).strip()
+    if bare != title:
+        aliases.add(bare)
+    if "," in bare:
+        # "Arthritis, rheumatoid" -> "rheumatoid arthritis"
+        head, _, tail = bare.partition(",")
+        aliases.add(f"{tail.strip()} {head.strip()}")
+    for phrase in ALSO_CALLED_RE.findall(text[:400]):
+        aliases.add(phrase)
+    return {normalize(a) for a in aliases if normalize(a)} - {normalize(title)}
+
+
+class TitleIndexWriter:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._titles = defaultdict(list)
+        self._aliases = {}
+        self._display = {}
+
+    def add(self, row, title, text):
+        key = normalize(title)
+        if not key:
+            return
+        if key not in self._titles:
+            self._display[key] = title
+            for alias in aliases_for(title, text):
+                self._aliases.setdefault(alias, key)
+        self._titles[key].append(row)
+
+    def close(self):
+        with open(os.path.join(self.directory, TITLES_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "titles": self._titles,
+                "aliases": {a: t for a, t in self._aliases.items() if a not in self._titles},
+                "display": self._display,
+            }, f, ensure_ascii=False)
+
+
+class TitleIndex:
+    def __init__(self, directory, fuzzy_cutoff=0.88):
+        with open(os.path.join(directory, TITLES_FILE), encoding="utf-8") as f:
+            data = json.load(f)
+        self.titles = data["titles"]
+        self.aliases = data["aliases"]
+        self.display = data.get("display", {})
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self._by_letter = defaultdict(list)
+        for key in list(self.titles) + list(self.aliases):
+            self._by_letter[key[:1]].append(key)
+
+    def _resolve(self, key):
+        if key in self.titles:
+            return key
+        return self.aliases.get(key)
+
+    def lookup(self, query):
+        """(title, rows, match) for a title-style query, or None"""
+        subject = extract_subject(query)
+        if not subject:
+            return None
+
+        # Plural questions ("what are ulcers") should reach singular entry titles
+        candidates = [subject]
+        if subject.endswith("ies"):
+            candidates.append(subject[:-3] + "y")
+        elif subject.endswith("s"):
+            candidates.append(subject[:-1])
+        for candidate in candidates:
+            title = self._resolve(candidate)
+            if title:
+                return title, self.titles[title], "title"
+
+        close = difflib.get_close_matches(subject, self._by_letter.get(subject[:1], ()), n=1, cutoff=self.fuzzy_cutoff)
+        if close:
+            title = self._resolve(close[0])
+            return title, self.titles[title], "fuzzy_title"
+        return None
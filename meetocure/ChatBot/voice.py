@@ -0,0 +1,387 @@
+"""Voice questions: recorded audio in, transcribed question, text answer and spoken answer out.
+
+The text stage is the MedicalAssistant pipeline used by /assistance; this
+module only adds the audio around it, without blocking the event loop:
+
+  decode   the upload (WAV read directly, WebM/Ogg/MP3 piped through ffmpeg)
+           is turned into 16 kHz mono PCM in a process pool, from and to
+           in-memory buffers; no temp files
+  stt      a speech recognizer, run on a small thread pool because the
+           engines are blocking network clients; the Telugu and English
+           attempts run concurrently
+  tts      a speech synthesizer, behind a content-addressed LRU of the
+           audio for each (answer, language), so repeated answers are not
+           synthesized again; concurrent misses for the same answer share
+           one synthesis
+
+Engines are chosen with CHATBOT_STT and CHATBOT_TTS. The local ones ("static"
+and "tone") need neither network nor credentials, for development and load
+tests.
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+import wave
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+import metrics
+from metrics import span
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+# Recognizer locales tried for each recording, with the answer language they map to
+LOCALES = {"te-IN": "te", "en-IN": "en"}
+
+
+class VoiceError(Exception):
+    """The recording could not be turned into a question; status_code is the HTTP status to answer with"""
+
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _decode_wav(data, sample_rate):
+    with wave.open(io.BytesIO(data)) as wav:
+        channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) * 256
+    elif width in (2, 4):
+        samples = np.frombuffer(frames, dtype=np.int16 if width == 2 else np.int32).astype(np.float32)
+        if width == 4:
+            samples /= 65536
+    else:
+        raise ValueError(f"Unsupported WAV sample width {width}")
+    samples = samples.reshape(-1, channels).mean(axis=1)
+    if rate != sample_rate and len(samples):
+        # Linear interpolation is plenty for speech going to a recognizer
+        positions = np.arange(int(len(samples) * sample_rate / rate)) * (rate / sample_rate)
+        samples = np.interp(positions, np.arange(len(samples)), samples)
+    return np.clip(samples, -32768, 32767).astype(np.int16).tobytes()
+
+
+def _decode_ffmpeg(data, sample_rate):
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise ValueError("ffmpeg is needed to decode compressed audio")
+    result = subprocess.run(
+        [ffmpeg, "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+         "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(sample_rate), "pipe:1"],
+        input=data, capture_output=True, timeout=60,
+    )
+    if result.returncode != 0:
+        raise ValueError(result.stderr.decode("utf-8", "replace").strip() or "ffmpeg failed")
+    return result.stdout
+
+
+def decode_audio(data, sample_rate=SAMPLE_RATE):
+    """16-bit mono PCM at sample_rate from an uploaded recording; runs in the decode process pool"""
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        return _decode_wav(data, sample_rate)
+    return _decode_ffmpeg(data, sample_rate)
+
+
+def pcm_to_wav(pcm, sample_rate=SAMPLE_RATE):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+class GoogleRecognizer:
+    """Google Web Speech through SpeechRecognition; needs network access"""
+
+    name = "google"
+
+    def __init__(self):
+        import speech_recognition as sr
+
+        self._sr = sr
+        self._recognizer = sr.Recognizer()
+
+    def recognize(self, pcm, sample_rate, locale):
+        """Transcript of pcm in locale, or "" if nothing was understood"""
+        audio = self._sr.AudioData(pcm, sample_rate, 2)
+        try:
+            return self._recognizer.recognize_google(audio, language=locale)
+        except self._sr.UnknownValueError:
+            return ""
+
+
+class StaticRecognizer:
+    """Local stand-in: hears the same question in every recording"""
+
+    name = "static"
+
+    def __init__(self, text=None, locale="en-IN", latency=0.0):
+        self.text = text or os.environ.get("CHATBOT_STT_STATIC_TEXT", "What are the symptoms of fever?")
+        self.locale = locale
+        self.latency = latency
+
+    def recognize(self, pcm, sample_rate, locale):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.text if locale == self.locale else ""
+
+
+class GTTSSynthesizer:
+    """Google Translate text-to-speech through gTTS; needs network access"""
+
+    name = "gtts"
+    mime = "audio/mpeg"
+
+    def synthesize(self, text, language):
+        from gtts import gTTS
+
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=language).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class ToneSynthesizer:
+    """Local stand-in: a WAV tone whose length follows the text, so cache sizes behave realistically"""
+
+    name = "tone"
+    mime = "audio/wav"
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def synthesize(self, text, language):
+        if self.latency:
+            time.sleep(self.latency)
+        # Roughly the pace of speech: 60 ms per character, 8 kHz
+        t = np.arange(int(len(text) * 0.06 * 8000)) / 8000
+        tone = (np.sin(2 * np.pi * (440 if language == "en" else 520) * t) * 8000).astype(np.int16)
+        return pcm_to_wav(tone.tobytes(), 8000)
+
+
+RECOGNIZERS = {"google": GoogleRecognizer, "static": StaticRecognizer}
+SYNTHESIZERS = {"gtts": GTTSSynthesizer, "tone": ToneSynthesizer}
+
+
+def load_engines(stt=None, tts=None):
+    """(recognizer, synthesizer or None) selected by name or by CHATBOT_STT / CHATBOT_TTS"""
+    stt = stt or os.environ.get("CHATBOT_STT", "google")
+    tts = tts or os.environ.get("CHATBOT_TTS", "gtts")
+    if stt not in RECOGNIZERS:
+        raise ValueError(f"Unknown recognizer {stt!r}; expected one of {', '.join(RECOGNIZERS)}")
+    if tts != "off" and tts not in SYNTHESIZERS:
+        raise ValueError(f"Unknown synthesizer {tts!r}; expected off or one of {', '.join(SYNTHESIZERS)}")
+    return RECOGNIZERS[stt](), (SYNTHESIZERS[tts]() if tts != "off" else None)
+
+
+class AudioCache:
+    """LRU of synthesized audio keyed by a hash of (language, text), bounded by total bytes"""
+
+    def __init__(self, max_bytes=64 * 2**20):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(text, language):
+        return hashlib.blake2b(f"{language}\0{text}".encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            audio = self._entries.get(key)
+            if audio is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return audio
+
+    def put(self, key, audio):
+        if len(audio) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self._entries[key] = audio
+            self.bytes += len(audio)
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class VoicePipeline:
+    def __init__(self, recognizer=None, synthesizer=None, decode_workers=None, io_workers=None,
+                 cache_bytes=None, max_seconds=None):
+        if recognizer is None:
+            recognizer, synthesizer = load_engines()
+        self.recognizer = recognizer
+        self.synthesizer = synthesizer
+        self.decode_workers = decode_workers or int(os.environ.get("CHATBOT_VOICE_DECODE_WORKERS", "2"))
+        self.max_seconds = max_seconds or float(os.environ.get("CHATBOT_VOICE_MAX_SECONDS", "60"))
+        self.io_executor = ThreadPoolExecutor(
+            max_workers=io_workers or int(os.environ.get("CHATBOT_VOICE_THREADS", "8")),
+            thread_name_prefix="voice",
+        )
+        self.audio_cache = AudioCache(
+            cache_bytes if cache_bytes is not None else int(float(os.environ.get("CHATBOT_TTS_CACHE_MB", "64")) * 2**20)
+        )
+        self.flights = SingleFlight()
+        # Created on first use, so it is never inherited across a gunicorn fork
+        self._decoder = None
+        self._decoder_lock = threading.Lock()
+        self.decoded_seconds = 0.0
+
+    def _decode_pool(self):
+        with self._decoder_lock:
+            if self._decoder is None:
+                import multiprocessing
+
+                # spawn: the workers start clean instead of copying this process's threads and model
+                self._decoder = ProcessPoolExecutor(
+                    max_workers=self.decode_workers, mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._decoder
+
+    async def awarm_up(self):
+        """Start the decode processes now rather than on the first voice request"""
+        loop = asyncio.get_running_loop()
+        pool = await loop.run_in_executor(self.io_executor, self._decode_pool)
+        silence = pcm_to_wav(b"\0\0" * 160)
+        await asyncio.gather(*(loop.run_in_executor(pool, decode_audio, silence) for _ in range(self.decode_workers)))
+
+    async def adecode(self, data, stats):
+        loop = asyncio.get_running_loop()
+        pool = self._decode_pool()
+        with span(stats, "decode"):
+            try:
+                pcm = await loop.run_in_executor(pool, decode_audio, data)
+            except (ValueError, EOFError, wave.Error) as exc:
+                raise VoiceError(422, f"Could not decode audio: {exc}") from exc
+            except BrokenProcessPool as exc:
+                # A decoder process died; the next request starts a fresh pool
+                with self._decoder_lock:
+                    if self._decoder is pool:
+                        self._decoder = None
+                raise VoiceError(503, "Audio decoder restarted, please retry") from exc
+        seconds = len(pcm) / 2 / SAMPLE_RATE
+        stats["audio_seconds"] = round(seconds, 2)
+        if not pcm:
+            raise VoiceError(422, "The recording is empty")
+        if seconds > self.max_seconds:
+            raise VoiceError(413, f"Recordings are limited to {self.max_seconds:g} seconds")
+        self.decoded_seconds += seconds
+        return pcm
+
+    async def atranscribe(self, pcm, stats):
+        """(transcript, language); each locale is tried at once and the fuller transcript wins"""
+        loop = asyncio.get_running_loop()
+        with span(stats, "stt"):
+            results = await asyncio.gather(
+                *(loop.run_in_executor(self.io_executor, self.recognizer.recognize, pcm, SAMPLE_RATE, locale)
+                  for locale in LOCALES),
+                return_exceptions=True,
+            )
+        transcripts = {}
+        for locale, result in zip(LOCALES, results):
+            if isinstance(result, Exception):
+                logger.warning("Speech recognition (%s) failed: %s: %s", locale, type(result).__name__, result)
+            elif result and result.strip():
+                transcripts[LOCALES[locale]] = result.strip()
+        if not transcripts:
+            if results and all(isinstance(r, Exception) for r in results):
+                raise VoiceError(502, "Speech recognition is unavailable")
+            raise VoiceError(422, "Could not understand the recording")
+        # Telugu wins ties: en-IN mangles Telugu speech into short English words
+        language = max(transcripts, key=lambda lang: (len(transcripts[lang]), lang == "te"))
+        return transcripts[language], language
+
+    async def asynthesize(self, text, language, stats):
+        """Spoken answer as bytes, or None without a synthesizer; a failed synthesis leaves the text answer"""
+        if self.synthesizer is None or not text:
+            return None
+        key = AudioCache.key(text, language)
+        audio = self.audio_cache.get(key)
+        if audio is not None:
+            stats["tts_cache"] = "hit"
+            return audio
+        stats["tts_cache"] = "miss"
+
+        async def synthesize():
+            loop = asyncio.get_running_loop()
+            audio = await loop.run_in_executor(self.io_executor, self.synthesizer.synthesize, text, language)
+            self.audio_cache.put(key, audio)
+            return audio
+
+        with span(stats, "tts"):
+            try:
+                audio, coalesced = await self.flights.run(key, synthesize)
+            except Exception as exc:
+                logger.warning("Speech synthesis failed: %s: %s", type(exc).__name__, exc)
+                stats["tts_error"] = type(exc).__name__
+                return None
+        if coalesced:
+            stats["tts_cache"] = "coalesced"
+        return audio
+
+    async def aanswer(self, data, answer_text, stats, speak=True):
+        """Decode, transcribe, answer with answer_text(question, stats) and speak the answer"""
+        answered = False
+        try:
+            pcm = await self.adecode(data, stats)
+            transcription, language = await self.atranscribe(pcm, stats)
+            stats["lang_detected"] = language
+            answer = await answer_text(transcription, stats)
+            answered = True
+            result = {"transcription": transcription, "answer": answer, "lang_detected": language}
+            audio = await self.asynthesize(answer, language, stats) if speak else None
+        finally:
+            # An answered question had its earlier stages observed with the text pipeline's
+            timings = stats.get("timings_ms", {})
+            for stage in ("tts",) if answered else ("decode", "stt"):
+                if stage in timings:
+                    metrics.STAGE_SECONDS.observe(timings[stage] / 1000, stage=stage, route="voice")
+        if audio is not None:
+            result["audio_base64"] = base64.b64encode(audio).decode("ascii")
+            result["audio_mime"] = self.synthesizer.mime
+        return result
+
+    def stats(self):
+        return {
+            "stt": self.recognizer.name,
+            "tts": self.synthesizer.name if self.synthesizer else None,
+            "decode_workers": self.decode_workers,
+            "decoded_seconds": round(self.decoded_seconds, 1),
+            "audio_cache": self.audio_cache.stats(),
+            "synthesis": self.flights.stats(),
+        }
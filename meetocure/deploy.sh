@@ -30,7 +30,7 @@ export DEBIAN_FRONTEND=noninteractive
 # ====== BASE PACKAGES ======
 apt-get update
 apt-get upgrade -y
-apt-get install -y curl git nginx ufw software-properties-common python3-venv python3-pip certbot python3-certbot-nginx gnupg
+apt-get install -y curl git nginx ufw software-properties-common python3-venv python3-pip certbot python3-certbot-nginx gnupg ffmpeg
 
 # ====== NODE 20 ======
 if ! command -v node >/dev/null 2>&1; then
@@ -167,7 +167,7 @@ if [ -d "$CHATBOT_DIR" ]; then
   python3 -m venv .venv
   . .venv/bin/activate
   pip install --upgrade pip
-  pip install -r requirement.txt
+  pip install -r requirements.txt
   pip install gunicorn
   deactivate
   # Create ChatBot/.env if missing
@@ -176,6 +176,8 @@ if [ -d "$CHATBOT_DIR" ]; then
     cat > "$CHATBOT_DIR/.env" <<EOF
 ALLOWED_ORIGINS=https://$DOMAIN,http://localhost:5173,http://localhost:3000
 # TOGETHER_API_KEY=   # Add if you want AI chat to respond
+CHATBOT_BIND=127.0.0.1:5001
+CHATBOT_WORKERS=2
 EOF
     chown ubuntu:ubuntu "$CHATBOT_DIR/.env"
     chmod 640 "$CHATBOT_DIR/.env"
@@ -211,7 +213,8 @@ After=network.target
 [Service]
 WorkingDirectory=$CHATBOT_DIR
 EnvironmentFile=$CHATBOT_DIR/.env
-ExecStart=$CHATBOT_DIR/.venv/bin/gunicorn -w 2 -b 127.0.0.1:5001 chatbot:app
+# gunicorn.conf.py: uvicorn workers forked after the embedding model and index are preloaded
+ExecStart=$CHATBOT_DIR/.venv/bin/gunicorn -c gunicorn.conf.py main:app
 Restart=always
 RestartSec=5
 User=ubuntu
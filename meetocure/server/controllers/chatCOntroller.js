@@ -6,6 +6,19 @@ const Patient = require("../models/Patient");
 const Doctor = require("../models/DoctorShema");
 const FormData = require("form-data");
 
+// Pass the chatbot's load-shedding responses (429/503 + Retry-After) through to the client
+const sendChatbotBusy = (res, error) => {
+  const status = error?.response?.status;
+  if (status !== 429 && status !== 503) return false;
+  const retryAfter = error.response.headers?.["retry-after"];
+  if (retryAfter) res.set("Retry-After", retryAfter);
+  res.status(status).json({
+    message: "AI assistant is busy, please try again shortly",
+    retryAfter: Number(retryAfter) || undefined,
+  });
+  return true;
+};
+
 const chatWithVoice = async (req, res) => {
   try {
     const { patientId } = req.body;
@@ -41,7 +54,7 @@ const chatWithVoice = async (req, res) => {
       maxBodyLength: Infinity,
     });
 
-    const { transcription, answer, lang_detected } = response.data;
+    const { transcription, answer, lang_detected, audio_base64, audio_mime } = response.data;
 
     // Save transcription as patient message
     await PatientChat.create({
@@ -61,6 +74,8 @@ const chatWithVoice = async (req, res) => {
       transcription,
       answer,
       lang_detected,
+      audio_base64,
+      audio_mime,
       success: true,
     });
   } catch (error) {
@@ -68,6 +83,7 @@ const chatWithVoice = async (req, res) => {
       "Error processing voice chat:",
       error?.response?.data || error.message || error
     );
+    if (sendChatbotBusy(res, error)) return;
     return res.status(500).json({
       message: "Voice processing error",
       error: error?.response?.data || error?.message || String(error),
@@ -102,7 +118,7 @@ const chatWithFlaskAI = async (req, res) => {
     const flaskBase = process.env.CHATBOT_URL; // update if needed
     const flaskResponse = await axios.post(
       `${flaskBase}/assistance`,
-      { text: message } // must match FastAPI schema
+      { text: message, patientId, priority: "patient" } // must match FastAPI schema
     );
 
     // accept either 'reply' (FastAPI) or 'answer' (older expectation)
@@ -128,6 +144,7 @@ const chatWithFlaskAI = async (req, res) => {
       "Error communicating with Flask chatbot:",
       error?.message || error
     );
+    if (sendChatbotBusy(res, error)) return;
     return res.status(500).json({
       message: "Flask AI service error",
       error: error?.message || String(error),
@@ -150,6 +167,12 @@ const deleteChatsForPatient = async (req, res) => {
     // delete all chat documents for this patient
     await PatientChat.deleteMany({ patient: patient._id });
 
+    // drop the chatbot's conversation session as well (best effort)
+    const flaskBase = process.env.CHATBOT_URL;
+    await axios
+      .delete(`${flaskBase}/assistance/session/patient:${patientId}`)
+      .catch(() => {});
+
     return res
       .status(200)
       .json({ success: true, message: "All chats deleted for patient" });
@@ -185,7 +208,7 @@ const doctorChatWithAI = async (req, res) => {
     const flaskBase = process.env.CHATBOT_URL;
     const flaskResponse = await axios.post(
       `${flaskBase}/assistance`,
-      { text: message } // must match FastAPI schema
+      { text: message, doctorId, priority: "doctor" } // must match FastAPI schema
     );
     const data = flaskResponse.data || {};
     const aiMessage = data.reply || data.answer || "No response from AI.";
@@ -201,6 +224,7 @@ const doctorChatWithAI = async (req, res) => {
     res.json(aiResponse);
   } catch (error) {
     console.error("Doctor AI chat error:", error);
+    if (sendChatbotBusy(res, error)) return;
     res.status(500).json({ message: error.message });
   }
 };
@@ -221,6 +245,10 @@ const deleteDoctorAIChats = async (req, res) => {
   try {
     const { doctorId } = req.params;
     await DoctorAIChat.deleteMany({ doctor: doctorId });
+    const flaskBase = process.env.CHATBOT_URL;
+    await axios
+      .delete(`${flaskBase}/assistance/session/doctor:${doctorId}`)
+      .catch(() => {});
     res.json({ message: "Chat history cleared" });
   } catch (error) {
     res.status(500).json({ message: error.message });